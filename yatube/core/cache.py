@@ -0,0 +1,371 @@
+"""Кеш-бэкенды для запуска в несколько процессов.
+
+SQLiteCache хранит записи в одном файле SQLite в режиме WAL, поэтому
+общий кеш видят все воркеры на машине без отдельного сервера.
+TwoTierCache ставит перед любым общим кешем небольшой LRU в памяти
+процесса: горячие ключи читаются без обращения к общему хранилищу.
+MeasuredCache передаёт обращения другому кешу и считает попадания и
+промахи для замеров запроса (core.metrics).
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.utils.functional import cached_property
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from . import metrics
+
+MISSING = object()
+
+# Локальный уровень общий для всех потоков процесса, как у LocMemCache.
+_local_entries = {}
+_local_locks = {}
+
+
+class SQLiteCache(BaseCache):
+    """Общий кеш в файле SQLite, LOCATION — путь к файлу."""
+    cull_every = 100
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = location
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(
+                self._path, timeout=30, isolation_level=None
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                'key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)'
+            )
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+            self._local.sets = 0
+        return connection
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _live(self):
+        return '(expires IS NULL OR expires > ?)', time.time()
+
+    def get(self, key, default=None, version=None):
+        condition, now = self._live()
+        row = self._connection().execute(
+            f'SELECT value FROM cache WHERE key = ? AND {condition}',
+            (self._key(key, version), now)
+        ).fetchone()
+        return default if row is None else pickle.loads(row[0])
+
+    def get_many(self, keys, version=None):
+        names = {self._key(key, version): key for key in keys}
+        if not names:
+            return {}
+        condition, now = self._live()
+        placeholders = ', '.join('?' * len(names))
+        rows = self._connection().execute(
+            f'SELECT key, value FROM cache '
+            f'WHERE key IN ({placeholders}) AND {condition}',
+            (*names, now)
+        )
+        return {names[key]: pickle.loads(value) for key, value in rows}
+
+    def _store(self, mode, key, value, timeout, version):
+        connection = self._connection()
+        cursor = connection.execute(
+            f'INSERT OR {mode} INTO cache (key, value, expires) '
+            f'VALUES (?, ?, ?)',
+            (
+                self._key(key, version),
+                pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                self.get_backend_timeout(timeout),
+            )
+        )
+        self._local.sets += 1
+        if self._local.sets % self.cull_every == 0:
+            self._cull(connection)
+        return cursor.rowcount > 0
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._store('REPLACE', key, value, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        connection = self._connection()
+        connection.execute('BEGIN')
+        try:
+            for key, value in data.items():
+                self._store('REPLACE', key, value, timeout, version)
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        connection = self._connection()
+        condition, now = self._live()
+        connection.execute(
+            f'DELETE FROM cache WHERE key = ? AND NOT {condition}',
+            (self._key(key, version), now)
+        )
+        return self._store('IGNORE', key, value, timeout, version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        condition, now = self._live()
+        cursor = self._connection().execute(
+            f'UPDATE cache SET expires = ? WHERE key = ? AND {condition}',
+            (self.get_backend_timeout(timeout), self._key(key, version), now)
+        )
+        return cursor.rowcount > 0
+
+    def incr(self, key, delta=1, version=None):
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            value = self.get(key, MISSING, version)
+            if value is MISSING:
+                raise ValueError(f"Key '{key}' not found")
+            value += delta
+            connection.execute(
+                'UPDATE cache SET value = ? WHERE key = ?',
+                (
+                    pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                    self._key(key, version),
+                )
+            )
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return value
+
+    def delete(self, key, version=None):
+        self._connection().execute(
+            'DELETE FROM cache WHERE key = ?', (self._key(key, version),)
+        )
+
+    def delete_many(self, keys, version=None):
+        keys = [self._key(key, version) for key in keys]
+        if keys:
+            placeholders = ', '.join('?' * len(keys))
+            self._connection().execute(
+                f'DELETE FROM cache WHERE key IN ({placeholders})', keys
+            )
+
+    def has_key(self, key, version=None):
+        return self.get(key, MISSING, version) is not MISSING
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cache')
+
+    def _cull(self, connection):
+        connection.execute(
+            'DELETE FROM cache WHERE expires <= ?', (time.time(),)
+        )
+        count, = connection.execute('SELECT COUNT(*) FROM cache').fetchone()
+        if count > self._max_entries:
+            connection.execute(
+                'DELETE FROM cache WHERE key IN ('
+                'SELECT key FROM cache ORDER BY rowid LIMIT ?)',
+                (count // self._cull_frequency,)
+            )
+
+
+class TwoTierCache(BaseCache):
+    """Локальный LRU процесса перед общим кешем.
+
+    LOCATION — алиас общего кеша из settings.CACHES. Локальная копия
+    живёт не дольше OPTIONS['LOCAL_TIMEOUT'] секунд, поэтому запись из
+    другого процесса станет видна не позже чем через это время.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._shared_alias = location
+        options = params.get('OPTIONS', {})
+        self._local_timeout = options.get('LOCAL_TIMEOUT', 5)
+        self._entries = _local_entries.setdefault(location, OrderedDict())
+        self._lock = _local_locks.setdefault(location, threading.Lock())
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    @cached_property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    def _remember(self, key, value, version, timeout=DEFAULT_TIMEOUT):
+        expires = time.time() + self._local_timeout
+        backend_timeout = self.get_backend_timeout(timeout)
+        if backend_timeout is not None:
+            expires = min(expires, backend_timeout)
+        name = self.make_key(key, version=version)
+        with self._lock:
+            self._entries[name] = (value, expires)
+            self._entries.move_to_end(name)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def _recall(self, key, version):
+        name = self.make_key(key, version=version)
+        with self._lock:
+            value, expires = self._entries.get(name, (MISSING, 0))
+            if value is MISSING:
+                return MISSING
+            if expires <= time.time():
+                del self._entries[name]
+                return MISSING
+            self._entries.move_to_end(name)
+            return value
+
+    def _forget(self, key, version):
+        with self._lock:
+            self._entries.pop(self.make_key(key, version=version), None)
+
+    def get(self, key, default=None, version=None):
+        value = self._recall(key, version)
+        if value is not MISSING:
+            self.local_hits += 1
+            return value
+        value = self.shared.get(key, MISSING, version=version)
+        if value is MISSING:
+            self.misses += 1
+            return default
+        self.shared_hits += 1
+        self._remember(key, value, version)
+        return value
+
+    def get_many(self, keys, version=None):
+        found = {}
+        for key in keys:
+            value = self._recall(key, version)
+            if value is not MISSING:
+                found[key] = value
+        self.local_hits += len(found)
+        rest = [key for key in keys if key not in found]
+        if rest:
+            shared = self.shared.get_many(rest, version=version)
+            self.shared_hits += len(shared)
+            self.misses += len(rest) - len(shared)
+            for key, value in shared.items():
+                self._remember(key, value, version)
+            found.update(shared)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version=version)
+        self._remember(key, value, version, timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout, version=version) or []
+        for key, value in data.items():
+            if key not in failed:
+                self._remember(key, value, version, timeout)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.shared.add(key, value, timeout, version=version)
+        if added:
+            self._remember(key, value, version, timeout)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        self._forget(key, version)
+        return self.shared.incr(key, delta, version=version)
+
+    def delete(self, key, version=None):
+        self._forget(key, version)
+        self.shared.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        for key in keys:
+            self._forget(key, version)
+        self.shared.delete_many(keys, version=version)
+
+    def has_key(self, key, version=None):
+        if self._recall(key, version) is not MISSING:
+            return True
+        return self.shared.has_key(key, version=version)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        self.shared.clear()
+
+
+class MeasuredCache(BaseCache):
+    """Кеш LOCATION с подсчётом попаданий и промахов в замерах запроса.
+
+    Оборачивается алиас, к которому обращается код; вложенные обращения
+    (TwoTierCache к общему кешу) идут мимо обёртки и не считаются.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._alias = location
+
+    @cached_property
+    def cache(self):
+        return caches[self._alias]
+
+    def get(self, key, default=None, version=None):
+        value = self.cache.get(key, MISSING, version=version)
+        if value is MISSING:
+            metrics.record_cache(0, 1)
+            return default
+        metrics.record_cache(1, 0)
+        return value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        found = self.cache.get_many(keys, version=version)
+        metrics.record_cache(len(found), len(keys) - len(found))
+        return found
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.cache.add(key, value, timeout, version)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.cache.set(key, value, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.cache.set_many(data, timeout, version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.cache.touch(key, timeout, version)
+
+    def incr(self, key, delta=1, version=None):
+        return self.cache.incr(key, delta, version)
+
+    def decr(self, key, delta=1, version=None):
+        return self.cache.decr(key, delta, version)
+
+    def delete(self, key, version=None):
+        return self.cache.delete(key, version)
+
+    def delete_many(self, keys, version=None):
+        return self.cache.delete_many(keys, version)
+
+    def has_key(self, key, version=None):
+        return self.cache.has_key(key, version)
+
+    def clear(self):
+        return self.cache.clear()
+
+    def close(self, **kwargs):
+        return self.cache.close(**kwargs)
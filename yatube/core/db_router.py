@@ -0,0 +1,85 @@
+"""Чтение с реплик, запись в основную базу.
+
+Во время запроса чтения уходят на одну из баз DATABASE_REPLICAS, а
+записи — в default. После записи клиент на REPLICA_STICKY_SECONDS
+получает cookie, и все его запросы читают из default, пока реплика не
+догонит основную базу. Вне запроса (команды, фоновые задачи) всё
+читается из default.
+
+Кеши с поколениями (posts.feed_cache) нельзя заполнять с отставшей
+реплики: поколение меняется при записи в основную базу, и реплика
+положила бы старые данные под новым поколением. Поэтому запрос, который
+прочитал поколение моложе REPLICA_STICKY_SECONDS, дочитывает всё из
+default (use_primary).
+"""
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+COOKIE_NAME = 'primary_until'
+
+_state = threading.local()
+
+
+def _replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def use_primary():
+    """До конца текущего запроса читать из основной базы."""
+    _state.use_primary = True
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not _replicas() or getattr(_state, 'use_primary', True):
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            # Внутри транзакции читаем то, что она уже записала.
+            return DEFAULT_DB_ALIAS
+        return random.choice(_replicas())
+
+    def db_for_write(self, model, **hints):
+        _state.use_primary = True
+        _state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *_replicas()}
+        return obj1._state.db in databases and obj2._state.db in databases
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема реплик приходит из основной базы вместе с данными.
+        return db not in _replicas()
+
+
+class ReplicaMiddleware:
+    """Включает чтение с реплик для безопасных запросов."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            pinned = float(request.COOKIES.get(COOKIE_NAME, 0)) > time.time()
+        except ValueError:
+            pinned = False
+        _state.use_primary = (
+            pinned or request.method not in ('GET', 'HEAD', 'OPTIONS')
+        )
+        _state.wrote = False
+        try:
+            response = self.get_response(request)
+        finally:
+            wrote = _state.wrote
+            _state.use_primary = True
+        if wrote:
+            sticky = settings.REPLICA_STICKY_SECONDS
+            response.set_cookie(
+                COOKIE_NAME, str(time.time() + sticky), max_age=sticky,
+                httponly=True, samesite='Lax'
+            )
+        return response
@@ -0,0 +1,99 @@
+import json
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+from core.cache import SQLiteCache, TwoTierCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+BACKENDS = ('locmem', 'sqlite', 'two-tier')
+
+
+def make_backend(name, path, local_entries):
+    if name == 'locmem':
+        return LocMemCache('bench', {'OPTIONS': {'MAX_ENTRIES': 100000}})
+    shared = SQLiteCache(path, {'OPTIONS': {'MAX_ENTRIES': 100000}})
+    if name == 'sqlite':
+        return shared
+    backend = TwoTierCache('bench', {
+        'OPTIONS': {'MAX_ENTRIES': local_entries, 'LOCAL_TIMEOUT': 5},
+    })
+    backend.shared = shared
+    return backend
+
+
+def run_worker(args):
+    """Имитирует поток запросов одного воркера к кешу страниц."""
+    name, path, seed, requests, weights, local_entries = args
+    backend = make_backend(name, path, local_entries)
+    keys = random.Random(seed).choices(
+        range(len(weights)), cum_weights=weights, k=requests
+    )
+    page = 'x' * 2048
+    hits = 0
+    started = time.perf_counter()
+    for key in keys:
+        if backend.get(f'page:{key}') is None:
+            backend.set(f'page:{key}', page, 300)
+        else:
+            hits += 1
+    elapsed = time.perf_counter() - started
+    return hits, elapsed
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает долю попаданий и скорость кеш-бэкендов '
+        'при работе нескольких процессов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, nargs='+', default=[1, 2, 4, 8]
+        )
+        parser.add_argument('--requests', type=int, default=5000)
+        parser.add_argument('--keys', type=int, default=2000)
+        parser.add_argument('--local-entries', type=int, default=200)
+        parser.add_argument('--backends', nargs='+', default=BACKENDS)
+        parser.add_argument('--output', help='Файл для результатов в JSON')
+
+    def handle(self, *args, **options):
+        # Популярность страниц распределена по закону Ципфа.
+        weights, total = [], 0
+        for rank in range(1, options['keys'] + 1):
+            total += 1 / rank ** 1.1
+            weights.append(total)
+        results = []
+        context = multiprocessing.get_context('spawn')
+        for workers in options['workers']:
+            for name in options['backends']:
+                with tempfile.TemporaryDirectory() as directory:
+                    path = os.path.join(directory, 'cache.sqlite3')
+                    jobs = [
+                        (name, path, seed, options['requests'], weights,
+                         options['local_entries'])
+                        for seed in range(workers)
+                    ]
+                    with context.Pool(workers) as pool:
+                        outcome = pool.map(run_worker, jobs)
+                hits = sum(hit for hit, _ in outcome)
+                requests = workers * options['requests']
+                elapsed = max(seconds for _, seconds in outcome)
+                result = {
+                    'backend': name,
+                    'workers': workers,
+                    'hit_rate': round(hits / requests, 4),
+                    'requests_per_second': round(requests / elapsed),
+                }
+                results.append(result)
+                self.stdout.write(
+                    '{backend:>9} workers={workers:<3} '
+                    'hit_rate={hit_rate:.2%} '
+                    'rps={requests_per_second}'.format(**result)
+                )
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
@@ -0,0 +1,66 @@
+import json
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+
+MIDDLEWARE = 'core.middleware.MetricsMiddleware'
+
+
+def measure(paths, requests):
+    client = Client()
+    timings = []
+    for _ in range(requests):
+        for path in paths:
+            started = time.perf_counter()
+            client.get(path)
+            timings.append(time.perf_counter() - started)
+    return timings
+
+
+class Command(BaseCommand):
+    help = (
+        'Измеряет накладные расходы MetricsMiddleware: время ответа '
+        'с включёнными и выключенными замерами.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--paths', nargs='+', default=['/', '/api/posts/']
+        )
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--output', help='Файл для результатов в JSON')
+
+    def handle(self, *args, **options):
+        without = [name for name in settings.MIDDLEWARE if name != MIDDLEWARE]
+        modes = {
+            'disabled': without,
+            'enabled': [MIDDLEWARE, *without],
+        }
+        results = {}
+        for mode, middleware in modes.items():
+            with override_settings(MIDDLEWARE=middleware,
+                                   METRICS_ENABLED=True):
+                # Прогрев: кеши, шаблоны и соединение с базой.
+                measure(options['paths'], 5)
+                timings = measure(options['paths'], options['requests'])
+            timings.sort()
+            results[mode] = {
+                'mean_ms': statistics.mean(timings) * 1000,
+                'p50_ms': timings[len(timings) // 2] * 1000,
+                'p95_ms': timings[int(len(timings) * 0.95)] * 1000,
+            }
+            self.stdout.write(
+                '{:>9}: среднее {mean_ms:.3f} мс, p50 {p50_ms:.3f} мс, '
+                'p95 {p95_ms:.3f} мс'.format(mode, **results[mode])
+            )
+        overhead = results['enabled']['mean_ms'] - results['disabled'][
+            'mean_ms'
+        ]
+        results['overhead_ms'] = overhead
+        self.stdout.write(f'Накладные расходы: {overhead:.3f} мс на запрос')
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
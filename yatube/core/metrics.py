@@ -0,0 +1,240 @@
+"""Сбор времени ответа, запросов к базе, рендеринга и обращений к кешу.
+
+Замеры текущего запроса хранятся в threading.local и заполняются
+тем, что подключено в настройках: execute_wrapper у соединений с базой
+(MetricsMiddleware), шаблонный бэкенд MeasuredTemplates в TEMPLATES и
+кеш-бэкенд core.cache.MeasuredCache в CACHES. Итоги запроса складываются
+в гистограммы процесса, которые отдаёт /metrics/.
+"""
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.template.backends.django import DjangoTemplates
+
+TIME_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, float('inf')
+)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, float('inf'))
+
+_state = threading.local()
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def server_timing(self, total):
+        return ', '.join([
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"',
+            f'tpl;dur={self.template_time * 1000:.1f}',
+            f'cache;desc="{self.cache_hits} hits, '
+            f'{self.cache_misses} misses"',
+            f'total;dur={total * 1000:.1f}',
+        ])
+
+
+def is_visible(request):
+    """Замеры видны только персоналу и адресам из INTERNAL_IPS."""
+    if request.META.get('REMOTE_ADDR') in settings.INTERNAL_IPS:
+        return True
+    user = getattr(request, 'user', None)
+    return user is not None and user.is_staff
+
+
+def current():
+    return getattr(_state, 'metrics', None)
+
+
+def start():
+    _state.metrics = RequestMetrics()
+    return _state.metrics
+
+
+def stop():
+    _state.metrics = None
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Верхняя граница корзины, в которую попадает квантиль q."""
+        if not self.count:
+            return None
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.buckets[-1]
+
+
+class Registry:
+    """Гистограммы по имени view, общие для всех потоков процесса."""
+    metrics = {
+        'duration_seconds': TIME_BUCKETS,
+        'db_seconds': TIME_BUCKETS,
+        'template_seconds': TIME_BUCKETS,
+        'db_queries': COUNT_BUCKETS,
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self.histograms = {}
+            self.cache_hits = {}
+            self.cache_misses = {}
+
+    def observe(self, view, metrics, total):
+        values = {
+            'duration_seconds': total,
+            'db_seconds': metrics.db_time,
+            'template_seconds': metrics.template_time,
+            'db_queries': metrics.queries,
+        }
+        with self._lock:
+            for name, value in values.items():
+                histogram = self.histograms.get((view, name))
+                if histogram is None:
+                    histogram = Histogram(self.metrics[name])
+                    self.histograms[(view, name)] = histogram
+                histogram.observe(value)
+            self.cache_hits[view] = (
+                self.cache_hits.get(view, 0) + metrics.cache_hits
+            )
+            self.cache_misses[view] = (
+                self.cache_misses.get(view, 0) + metrics.cache_misses
+            )
+
+    def snapshot(self):
+        with self._lock:
+            views = {}
+            for (view, name), histogram in sorted(self.histograms.items()):
+                views.setdefault(view, {
+                    'cache_hits': self.cache_hits[view],
+                    'cache_misses': self.cache_misses[view],
+                })[name] = {
+                    'count': histogram.count,
+                    'sum': histogram.sum,
+                    'p50': histogram.quantile(0.5),
+                    'p95': histogram.quantile(0.95),
+                    'p99': histogram.quantile(0.99),
+                }
+            return views
+
+    def prometheus(self):
+        """Текстовый формат экспозиции Prometheus."""
+        lines = []
+        with self._lock:
+            for name, _ in self.metrics.items():
+                lines.append(f'# TYPE yatube_view_{name} histogram')
+                for (view, metric), histogram in sorted(
+                    self.histograms.items()
+                ):
+                    if metric != name:
+                        continue
+                    seen = 0
+                    for bound, count in zip(
+                        histogram.buckets, histogram.counts
+                    ):
+                        seen += count
+                        le = '+Inf' if bound == float('inf') else bound
+                        lines.append(
+                            f'yatube_view_{name}_bucket'
+                            f'{{view="{view}",le="{le}"}} {seen}'
+                        )
+                    lines.append(
+                        f'yatube_view_{name}_sum{{view="{view}"}} '
+                        f'{histogram.sum}'
+                    )
+                    lines.append(
+                        f'yatube_view_{name}_count{{view="{view}"}} '
+                        f'{histogram.count}'
+                    )
+            for name, values in (
+                ('hits', self.cache_hits), ('misses', self.cache_misses)
+            ):
+                lines.append(f'# TYPE yatube_view_cache_{name} counter')
+                for view, value in sorted(values.items()):
+                    lines.append(
+                        f'yatube_view_cache_{name}_total'
+                        f'{{view="{view}"}} {value}'
+                    )
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = current()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.db_time += time.perf_counter() - started
+
+
+def record_cache(hits, misses):
+    metrics = current()
+    if metrics is not None:
+        metrics.cache_hits += hits
+        metrics.cache_misses += misses
+
+
+class MeasuredTemplate:
+    """Шаблон бэкенда Django, время render которого входит в замеры."""
+
+    def __init__(self, template):
+        # Атрибуты шаблона (template, origin) доступны через __getattr__.
+        self._wrapped = template
+
+    def __getattr__(self, name):
+        return getattr(self._wrapped, name)
+
+    def render(self, context=None, request=None):
+        metrics = current()
+        if metrics is None or metrics.template_depth:
+            return self._wrapped.render(context, request)
+        # Время считается только для внешнего шаблона: render_to_string
+        # внутри тегов уже входит в него.
+        metrics.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return self._wrapped.render(context, request)
+        finally:
+            metrics.template_depth -= 1
+            metrics.template_time += time.perf_counter() - started
+
+
+class MeasuredTemplates(DjangoTemplates):
+    """Бэкенд DjangoTemplates, замеряющий рендеринг шаблонов."""
+
+    def from_string(self, template_code):
+        return MeasuredTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return MeasuredTemplate(super().get_template(template_name))
@@ -0,0 +1,43 @@
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from . import metrics
+
+
+class MetricsMiddleware:
+    """Замеряет запрос и добавляет к ответу заголовок Server-Timing.
+
+    Заголовок получают только те, кому доступен /metrics/: число запросов
+    и время ответа не показываются посторонним.
+
+    Включается настройкой METRICS_ENABLED и должен стоять первым в
+    MIDDLEWARE, чтобы учитывать работу остальных middleware.
+    """
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        current = metrics.start()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(metrics.record_query)
+                    )
+                response = self.get_response(request)
+        finally:
+            metrics.stop()
+        total = time.perf_counter() - current.started
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        metrics.registry.observe(view, current, total)
+        if settings.METRICS_SERVER_TIMING and metrics.is_visible(request):
+            response['Server-Timing'] = current.server_timing(total)
+        return response
@@ -0,0 +1,11 @@
+from django.db import models
+
+
+class StoredFile(models.Model):
+    """Файл в хранилище по содержимому и число ссылок на него."""
+    name = models.CharField(max_length=255, primary_key=True)
+    size = models.BigIntegerField()
+    references = models.IntegerField(default=0)
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,229 @@
+"""Отдача статики и загруженных файлов.
+
+Имена собранной статики содержат хеш (ManifestStaticFilesStorage), а
+картинки постов лежат под хешем содержимого (core.storage), поэтому такие
+файлы никогда не меняются и отдаются с Cache-Control: immutable на год.
+Остальные файлы кешируются ненадолго и проверяются по ETag и
+Last-Modified. Если клиент принимает brotli или gzip и рядом лежит
+сжатый при collectstatic вариант, отдаётся он. Запросы Range получают
+ответ 206 с одним диапазоном.
+
+Полный файл отдаётся FileResponse: WSGI-сервер с wsgi.file_wrapper
+(gunicorn, uWSGI) пишет его в сокет через sendfile без копирования в
+Python. Если перед приложением стоит nginx или Apache, SENDFILE_HEADER
+позволяет вовсе не читать файл: ответ содержит только заголовок
+X-Accel-Redirect или X-Sendfile, файл отдаёт сам веб-сервер.
+"""
+import mimetypes
+import os
+import re
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+IMMUTABLE_NAMES = re.compile(
+    # style.0123456789ab.css из ManifestStaticFilesStorage.
+    r'\.[0-9a-f]{12}\.\w+$'
+    # posts/ab/cd/abcd….jpg из ContentAddressedStorage.
+    r'|(^|/)[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.\w+$'
+)
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+# Порядок — по предпочтению сервера: brotli сжимает текст лучше gzip.
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeReader:
+    """Читает из файла не больше length байт с позиции start.
+
+    У объекта нет fileno, поэтому file_wrapper сервера не попытается
+    отправить через sendfile файл до конца.
+    """
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def accepted_encodings(request):
+    """Кодировки из Accept-Encoding, кроме запрещённых через q=0."""
+    accepted = set()
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = params.strip()
+        if quality.startswith('q=') and quality[2:].strip('0.') == '':
+            continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+def parse_range(header, size):
+    """(начало, конец) из заголовка Range или None.
+
+    Несколько диапазонов и некорректный заголовок дают None, то есть
+    весь файл. Невыполнимый диапазон — ValueError.
+    """
+    match = RANGE.match(header)
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        start, end = max(0, size - int(last)), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        raise ValueError(header)
+    return start, end
+
+
+def _etag(stats):
+    return '"{:x}-{:x}"'.format(stats.st_mtime_ns, stats.st_size)
+
+
+def _if_range_matches(request, etag, last_modified):
+    condition = request.META.get('HTTP_IF_RANGE')
+    if not condition:
+        return True
+    if condition.startswith('"'):
+        return condition == etag
+    return parse_http_date_safe(condition) == last_modified
+
+
+def _select_variant(request, path):
+    """Путь к файлу для ответа и его Content-Encoding."""
+    accepted = accepted_encodings(request)
+    for encoding, suffix in ENCODINGS:
+        if encoding in accepted and os.path.isfile(path + suffix):
+            return path + suffix, encoding
+    return path, None
+
+
+def _sendfile_response(request, path, suffix):
+    header = settings.SENDFILE_HEADER
+    response = HttpResponse()
+    if header == 'X-Accel-Redirect':
+        # Внутренний location nginx, например /internal/media/ с alias
+        # на MEDIA_ROOT.
+        response[header] = quote(
+            settings.SENDFILE_PREFIX + request.path + suffix
+        )
+    else:
+        response[header] = path
+    return response
+
+
+def _resolve(document_root, path):
+    try:
+        full_path = safe_join(document_root, path)
+        stats = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError, ValueError):
+        raise Http404('Файл не найден')
+    if not stat.S_ISREG(stats.st_mode):
+        raise Http404('Файл не найден')
+    return full_path, stats
+
+
+def _cache_control(path):
+    if IMMUTABLE_NAMES.search(path):
+        return f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    return f'public, max-age={settings.FILES_MAX_AGE}'
+
+
+def serve(request, path, document_root, precompressed=False):
+    """Отдаёт файл path из каталога document_root.
+
+    При precompressed рядом с файлом ищутся варианты .br и .gz.
+    """
+    full_path, stats = _resolve(document_root, path)
+    content_type, encoding = mimetypes.guess_type(full_path)
+    if encoding:
+        # Скачиваемый архив, а не текст, сжатый для передачи.
+        content_type = 'application/octet-stream'
+    variant, content_encoding = full_path, None
+    if precompressed:
+        variant, content_encoding = _select_variant(request, full_path)
+        stats = os.stat(variant)
+    etag = _etag(stats)
+    last_modified = int(stats.st_mtime)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    if response is None:
+        response = _file_response(
+            request, variant, stats, etag, last_modified,
+            variant[len(full_path):]
+        )
+        if response.status_code == 416:
+            return response
+        response['Content-Type'] = (
+            content_type or 'application/octet-stream'
+        )
+        if content_encoding:
+            response['Content-Encoding'] = content_encoding
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    if precompressed:
+        response['Vary'] = 'Accept-Encoding'
+    response['Cache-Control'] = _cache_control(path)
+    return response
+
+
+def _file_response(request, path, stats, etag, last_modified, suffix):
+    if settings.SENDFILE_HEADER:
+        # Диапазоны веб-сервер обработает сам.
+        return _sendfile_response(request, path, suffix)
+    size = stats.st_size
+    byte_range = None
+    if 'HTTP_RANGE' in request.META and _if_range_matches(
+        request, etag, last_modified
+    ):
+        try:
+            byte_range = parse_range(request.META['HTTP_RANGE'], size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+    if request.method == 'HEAD':
+        response = HttpResponse()
+    elif byte_range is None:
+        response = FileResponse(open(path, 'rb'))
+    else:
+        start, end = byte_range
+        response = FileResponse(
+            RangeReader(open(path, 'rb'), start, end - start + 1)
+        )
+    if byte_range is None:
+        response['Content-Length'] = size
+    else:
+        start, end = byte_range
+        response.status_code = 206
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = end - start + 1
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def serve_media(request, path):
+    return serve(request, path, settings.MEDIA_ROOT)
+
+
+def serve_static(request, path):
+    return serve(request, path, settings.STATIC_ROOT, precompressed=True)
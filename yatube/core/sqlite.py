@@ -0,0 +1,9 @@
+"""PRAGMA для новых соединений SQLite из настройки SQLITE_PRAGMAS."""
+from django.conf import settings
+
+
+def configure_connection(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    for name, value in settings.SQLITE_PRAGMAS.items():
+        connection.connection.execute(f'PRAGMA {name} = {value}')
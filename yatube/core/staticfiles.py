@@ -0,0 +1,55 @@
+"""Хранилище статики с хешами в именах и заранее сжатыми копиями.
+
+collectstatic кладёт рядом с каждым хешированным текстовым файлом
+style.0123456789ab.css его копии style.0123456789ab.css.gz и, если
+установлен пакет brotli, style.0123456789ab.css.br. При запросе
+core.serving выбирает подходящую копию, поэтому сжатие не тратит время
+на каждом ответе и идёт с максимальным уровнем.
+"""
+import gzip
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = (
+    '.css', '.js', '.map', '.json', '.svg', '.txt', '.html', '.xml',
+    '.ico', '.ttf', '.otf', '.eot',
+)
+# Меньшие файлы помещаются в один пакет и без сжатия.
+MIN_SIZE = 512
+
+
+def compressors():
+    yield '.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0)
+    if brotli is not None:
+        yield '.br', lambda data: brotli.compress(data, quality=11)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        # Имена берутся из готового манифеста: css с ссылками на другие
+        # файлы переименовывается несколько раз за проход.
+        for name in sorted(set(self.hashed_files.values())):
+            if name.lower().endswith(COMPRESSIBLE):
+                self.compress(name)
+
+    def compress(self, name):
+        with self.open(name) as original:
+            data = original.read()
+        if len(data) < MIN_SIZE:
+            return
+        for suffix, compress in compressors():
+            compressed = compress(data)
+            # Копия, которая почти не меньше оригинала, не нужна.
+            if len(compressed) >= len(data) * 0.95:
+                continue
+            path = self.path(name + suffix)
+            with open(path, 'wb') as output:
+                output.write(compressed)
@@ -0,0 +1,73 @@
+"""Хранилище файлов по содержимому.
+
+Файл сохраняется под именем из SHA-256 своего содержимого в каталогах
+по первым байтам хеша: posts/ab/cd/abcd….jpg. Повторная загрузка того же
+файла не пишет его второй раз, а увеличивает счётчик ссылок в
+StoredFile; delete уменьшает счётчик и удаляет файл, только когда на
+него больше никто не ссылается. Файлы без строки StoredFile (сохранённые
+до перехода на это хранилище) удаляются сразу.
+"""
+import hashlib
+import posixpath
+
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+
+from .models import StoredFile
+
+
+def file_hash(content):
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+def add_reference(name, size, count=1):
+    references = StoredFile.objects.filter(name=name)
+    if not references.update(references=F('references') + count):
+        StoredFile.objects.get_or_create(name=name, defaults={'size': size})
+        references.update(references=F('references') + count)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def content_name(self, name, digest):
+        """Имя в хранилище для файла name с хешем digest."""
+        directory = posixpath.dirname(name)
+        extension = posixpath.splitext(name)[1].lower()
+        return posixpath.join(
+            directory, digest[:2], digest[2:4], digest + extension
+        )
+
+    def _save(self, name, content):
+        # Хеш мог посчитать уже обработчик загрузки (см. posts.images).
+        digest = getattr(content, 'content_hash', None) or file_hash(content)
+        name = self.content_name(name, digest)
+        if not self.exists(name):
+            saved = super()._save(name, content)
+            if saved != name:
+                # Тот же файл успел сохранить параллельный запрос.
+                super().delete(saved)
+        add_reference(name, content.size)
+        return name
+
+    def delete(self, name):
+        with transaction.atomic():
+            stored = StoredFile.objects.filter(name=name)
+            stored.update(references=F('references') - 1)
+            if stored.filter(references__gt=0).exists():
+                return
+            stored.delete()
+        super().delete(name)
+
+    def discard(self, name):
+        """Удаляет файл, на который не ссылается ни одна строка StoredFile.
+
+        Нужен после отката транзакции, в которой файл был сохранён:
+        счётчик откатился, а файл остался на диске.
+        """
+        if not StoredFile.objects.filter(name=name).exists():
+            super().delete(name)
@@ -1,4 +1,34 @@
-from django.test import Client, TestCase
+import importlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.http import HttpResponse
+from django.template import engines
+from django.test import (Client, RequestFactory, SimpleTestCase, TestCase,
+                         override_settings)
+from posts import feed_cache
+from yatube import settings as base_settings
+
+from . import db_router, metrics
+from .cache import SQLiteCache, TwoTierCache
+from .metrics import registry
+from .models import StoredFile
+from .serving import IMMUTABLE_MAX_AGE
+from .sqlite import configure_connection
+from .storage import ContentAddressedStorage
+
+User = get_user_model()
 
 
 class CoreURLTests(TestCase):
@@ -9,3 +39,357 @@ class CoreURLTests(TestCase):
         """Cтраница 404 отдает кастомный шаблон."""
         response = self.guest_client.get('/unexisting_page/')
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+class CacheBackendsTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.shared = SQLiteCache(
+            os.path.join(self.directory, 'cache.sqlite3'), {}
+        )
+        self.two_tier = TwoTierCache('tests', {})
+        self.two_tier.shared = self.shared
+        self.two_tier.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_sqlite_cache(self):
+        """Общий кеш в SQLite поддерживает основные операции."""
+        self.shared.set('key', {'value': 1})
+        self.assertEqual(self.shared.get('key'), {'value': 1})
+        self.assertFalse(self.shared.add('key', 'other'))
+        self.assertTrue(self.shared.add('new', 1))
+        self.assertEqual(self.shared.incr('new', 2), 3)
+        self.shared.set_many({'a': 1, 'b': 2})
+        self.assertEqual(
+            self.shared.get_many(['a', 'b', 'c']), {'a': 1, 'b': 2}
+        )
+        self.shared.set('expired', 1, timeout=0)
+        self.assertIsNone(self.shared.get('expired'))
+        self.shared.delete('key')
+        self.assertIsNone(self.shared.get('key'))
+
+    def test_two_tier_cache(self):
+        """Двухуровневый кеш читает общий кеш и запоминает ответ."""
+        self.shared.set('key', 'shared')
+        self.assertEqual(self.two_tier.get('key'), 'shared')
+        self.assertEqual(self.two_tier.get('key'), 'shared')
+        self.assertEqual(self.two_tier.shared_hits, 1)
+        self.assertEqual(self.two_tier.local_hits, 1)
+        self.two_tier.set('other', 'value')
+        self.assertEqual(self.shared.get('other'), 'value')
+        self.two_tier.delete('other')
+        self.assertIsNone(self.two_tier.get('other'))
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.guest_client = Client()
+        registry.clear()
+        cache.clear()
+
+    def test_backends_record_metrics(self):
+        """Кеш и шаблоны замеряются бэкендами из настроек."""
+        current = metrics.start()
+        self.addCleanup(metrics.stop)
+        cache.set('hit', 1)
+        cache.get('hit')
+        cache.get('miss')
+        cache.get_many(['hit', 'miss'])
+        engines['django'].from_string('{{ value }}').render({'value': 1})
+        self.assertEqual((current.cache_hits, current.cache_misses), (2, 2))
+        self.assertGreater(current.template_time, 0)
+
+    def test_server_timing(self):
+        """Ответ содержит замеры базы, шаблонов и кеша."""
+        User.objects.create_user(username='Author')
+        response = self.guest_client.get('/profile/Author/')
+        timing = response['Server-Timing']
+        for name in ('db;dur=', 'tpl;dur=', 'cache;desc=', 'total;dur='):
+            with self.subTest(name=name):
+                self.assertIn(name, timing)
+        self.assertNotIn('db;dur=0.0;desc="0 queries"', timing)
+        response = self.guest_client.get('/profile/Author/')
+        self.assertIn('desc="0 queries"', response['Server-Timing'])
+        view = registry.snapshot()['posts:profile']
+        self.assertEqual(view['duration_seconds']['count'], 2)
+        self.assertGreaterEqual(view['cache_hits'], 1)
+
+    def test_server_timing_hidden_from_outside(self):
+        """Посторонним адресам заголовок Server-Timing не отдаётся."""
+        response = self.guest_client.get('/', REMOTE_ADDR='10.0.0.1')
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertEqual(
+            registry.snapshot()['posts:index']['duration_seconds']['count'],
+            1
+        )
+
+    def test_metrics_endpoint(self):
+        """Гистограммы доступны только внутренним адресам и персоналу."""
+        self.guest_client.get('/')
+        response = self.guest_client.get('/metrics/')
+        self.assertContains(
+            response, 'yatube_view_duration_seconds_count{view="posts:index"}'
+        )
+        response = self.guest_client.get(
+            '/metrics/', REMOTE_ADDR='10.0.0.1'
+        )
+        self.assertEqual(response.status_code, 403)
+        data = self.guest_client.get('/metrics/', {'format': 'json'}).json()
+        self.assertIn('posts:index', data)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = db_router.ReplicaRouter()
+        self.factory = RequestFactory()
+        self.used = []
+        cache.clear()
+
+    def view(self, write=False):
+        def view(request):
+            if write:
+                self.router.db_for_write(User)
+            self.used.append(self.router.db_for_read(User))
+            return HttpResponse()
+        return db_router.ReplicaMiddleware(view)
+
+    def test_reads_outside_request_use_primary(self):
+        self.assertEqual(self.router.db_for_read(User), DEFAULT_DB_ALIAS)
+
+    def test_safe_request_reads_from_replica(self):
+        response = self.view()(self.factory.get('/'))
+        self.assertEqual(self.used, ['replica'])
+        self.assertNotIn(db_router.COOKIE_NAME, response.cookies)
+        self.assertEqual(self.router.db_for_read(User), DEFAULT_DB_ALIAS)
+
+    def test_unsafe_request_uses_primary(self):
+        self.view()(self.factory.post('/'))
+        self.assertEqual(self.used, [DEFAULT_DB_ALIAS])
+
+    def test_write_pins_client_to_primary(self):
+        response = self.view(write=True)(self.factory.get('/'))
+        self.assertEqual(self.used, [DEFAULT_DB_ALIAS])
+        cookie = response.cookies[db_router.COOKIE_NAME]
+        request = self.factory.get('/')
+        request.COOKIES[db_router.COOKIE_NAME] = cookie.value
+        self.view()(request)
+        self.assertEqual(self.used[-1], DEFAULT_DB_ALIAS)
+        request.COOKIES[db_router.COOKIE_NAME] = '0'
+        self.view()(request)
+        self.assertEqual(self.used[-1], 'replica')
+
+    def feed_view(self):
+        @feed_cache.cache_feed(feed_cache.GLOBAL)
+        def index(request):
+            self.used.append(self.router.db_for_read(User))
+            return HttpResponse()
+        return db_router.ReplicaMiddleware(index)
+
+    def feed_request(self):
+        request = self.factory.get('/')
+        request.user = AnonymousUser()
+        return request
+
+    def test_feed_cache_miss_reads_from_replica(self):
+        """Лента с давно не менявшимся поколением читается с реплики."""
+        started = time.time() - 60
+        with mock.patch.object(feed_cache.time, 'time', return_value=started):
+            feed_cache.bump(feed_cache.GLOBAL)
+        self.feed_view()(self.feed_request())
+        self.assertEqual(self.used, ['replica'])
+
+    def test_feed_cache_after_bump_reads_from_primary(self):
+        """Сразу после записи страница ленты собирается из default:
+        отставшая реплика не положит старые данные под новое поколение.
+        """
+        feed_cache.bump(feed_cache.GLOBAL)
+        response = self.feed_view()(self.feed_request())
+        self.assertEqual(self.used, [DEFAULT_DB_ALIAS])
+        self.assertNotIn(db_router.COOKIE_NAME, response.cookies)
+
+    def test_atomic_block_reads_from_primary(self):
+        with mock.patch.object(
+            connections[DEFAULT_DB_ALIAS], 'in_atomic_block', True
+        ):
+            self.view()(self.factory.get('/'))
+        self.assertEqual(self.used, [DEFAULT_DB_ALIAS])
+
+    def test_replicas_are_not_migrated(self):
+        self.assertFalse(self.router.allow_migrate('replica', 'posts'))
+        self.assertTrue(self.router.allow_migrate(DEFAULT_DB_ALIAS, 'posts'))
+
+
+class ProductionSettingsTests(SimpleTestCase):
+    def load(self, environ):
+        sys.modules.pop('yatube.settings_production', None)
+        self.addCleanup(sys.modules.pop, 'yatube.settings_production', None)
+        with mock.patch.dict(os.environ, environ):
+            return importlib.import_module('yatube.settings_production')
+
+    def test_secret_key_required(self):
+        with mock.patch.dict(os.environ):
+            os.environ.pop('YATUBE_SECRET_KEY', None)
+            with self.assertRaises(ImproperlyConfigured):
+                self.load({})
+
+    def test_base_settings_not_modified(self):
+        production = self.load({'YATUBE_SECRET_KEY': 'secret'})
+        self.assertEqual(production.SECRET_KEY, 'secret')
+        self.assertEqual(production.DATABASES['default']['CONN_MAX_AGE'], 600)
+        default = base_settings.DATABASES['default']
+        self.assertEqual(default.get('CONN_MAX_AGE', 0), 0)
+        self.assertNotIn('timeout', default.get('OPTIONS', {}))
+
+
+class SQLitePragmaTests(TestCase):
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas_applied_to_connection(self):
+        default = self.pragma('cache_size')
+        with self.settings(SQLITE_PRAGMAS={'cache_size': -4096}):
+            configure_connection(None, connection)
+            self.assertEqual(self.pragma('cache_size'), -4096)
+        with self.settings(SQLITE_PRAGMAS={'cache_size': default}):
+            configure_connection(None, connection)
+
+
+class ContentAddressedStorageTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.storage = ContentAddressedStorage(location=self.directory)
+
+    def test_identical_files_stored_once(self):
+        first = self.storage.save('posts/a.jpg', ContentFile(b'image'))
+        second = self.storage.save('posts/b.JPG', ContentFile(b'image'))
+        other = self.storage.save('posts/c.jpg', ContentFile(b'other'))
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        self.assertRegex(first, r'^posts/[0-9a-f]{2}/[0-9a-f]{2}/\w{64}\.jpg$')
+        self.assertEqual(StoredFile.objects.get(name=first).references, 2)
+
+    def test_file_deleted_with_last_reference(self):
+        name = self.storage.save('posts/a.jpg', ContentFile(b'image'))
+        self.storage.save('posts/b.jpg', ContentFile(b'image'))
+        self.storage.delete(name)
+        self.assertTrue(self.storage.exists(name))
+        self.storage.delete(name)
+        self.assertFalse(self.storage.exists(name))
+        self.assertFalse(StoredFile.objects.filter(name=name).exists())
+
+
+class FileServingTests(TestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        self.media_root = os.path.join(root, 'media')
+        self.static_root = os.path.join(root, 'static')
+        settings = override_settings(
+            MEDIA_ROOT=self.media_root, STATIC_ROOT=self.static_root
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.image = 'posts/ab/cd/' + 'abcd' * 16 + '.jpg'
+        self.write(self.media_root, self.image, b'0123456789')
+        self.write(self.media_root, 'legacy.jpg', b'legacy')
+
+    def write(self, root, name, content):
+        path = os.path.join(root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as output:
+            output.write(content)
+
+    def test_content_addressed_media_immutable(self):
+        response = self.client.get('/media/' + self.image)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(
+            response['Cache-Control'],
+            f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+        )
+        response = self.client.get('/media/legacy.jpg')
+        self.assertNotIn('immutable', response['Cache-Control'])
+
+    def test_conditional_request(self):
+        etag = self.client.get('/media/' + self.image)['ETag']
+        response = self.client.get(
+            '/media/' + self.image, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_range_request(self):
+        url = '/media/' + self.image
+        response = self.client.get(url, HTTP_RANGE='bytes=2-4')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 2-4/10')
+        self.assertEqual(b''.join(response.streaming_content), b'234')
+        response = self.client.get(url, HTTP_RANGE='bytes=-3')
+        self.assertEqual(b''.join(response.streaming_content), b'789')
+        response = self.client.get(url, HTTP_RANGE='bytes=20-')
+        self.assertEqual(response.status_code, 416)
+        response = self.client.get(
+            url, HTTP_RANGE='bytes=2-4', HTTP_IF_RANGE='"stale"'
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_precompressed_static(self):
+        name = 'css/app.0123456789ab.css'
+        self.write(self.static_root, name, b'body {}')
+        self.write(self.static_root, name + '.gz', b'gzipped')
+        url = '/static/css/app.0123456789ab.css'
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(b''.join(response.streaming_content), b'gzipped')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertEqual(b''.join(response.streaming_content), b'body {}')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_files_outside_root_not_served(self):
+        self.assertEqual(
+            self.client.get('/media/../etc/passwd').status_code, 404
+        )
+        self.assertEqual(self.client.get('/media/posts/').status_code, 404)
+
+    @override_settings(
+        SENDFILE_HEADER='X-Accel-Redirect', SENDFILE_PREFIX='/internal'
+    )
+    def test_sendfile_header(self):
+        response = self.client.get('/media/' + self.image)
+        self.assertEqual(
+            response['X-Accel-Redirect'], '/internal/media/' + self.image
+        )
+        self.assertEqual(response.content, b'')
+
+    def test_collectstatic_compresses_hashed_files(self):
+        source = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, source)
+        with open(os.path.join(source, 'app.css'), 'w') as output:
+            output.write('body { color: black; }\n' * 100)
+        with override_settings(
+            STATICFILES_DIRS=[source],
+            STATICFILES_FINDERS=[
+                'django.contrib.staticfiles.finders.FileSystemFinder'
+            ],
+            STATICFILES_STORAGE=(
+                'core.staticfiles.CompressedManifestStaticFilesStorage'
+            ),
+        ):
+            call_command('collectstatic', interactive=False, verbosity=0)
+        hashed = [
+            name for name in os.listdir(self.static_root)
+            if name.startswith('app.') and name.endswith('.css')
+            and name != 'app.css'
+        ]
+        self.assertEqual(len(hashed), 1)
+        self.assertTrue(
+            os.path.exists(os.path.join(self.static_root, hashed[0] + '.gz'))
+        )
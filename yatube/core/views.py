@@ -1,5 +1,8 @@
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse
 from django.shortcuts import render
 
+from .metrics import is_visible, registry
+
 
 def page_not_found(request, exception):
     return render(request, 'core/404.html', {'path': request.path}, status=404)
@@ -11,3 +14,13 @@ def csrf_failure(request, reason=''):
 
 def internal_server_error(request):
     return render(request, 'core/500.html')
+
+
+def metrics(request):
+    if not is_visible(request):
+        return HttpResponseForbidden()
+    if request.GET.get('format') == 'json':
+        return JsonResponse(registry.snapshot())
+    return HttpResponse(
+        registry.prometheus(), content_type='text/plain; version=0.0.4'
+    )
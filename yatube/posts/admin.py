@@ -1,6 +1,20 @@
 from django.contrib import admin
 
-from .models import Group, Post, Comment
+from . import export, search
+from .models import Comment, Follow, Group, Post
+
+# Админке хватает самых релевантных результатов, а список id уходит
+# в запрос целиком.
+SEARCH_LIMIT = 500
+
+
+def export_action(kind, format):
+    """Действие админки, потоково выгружающее выбранные записи."""
+    def action(modeladmin, request, queryset):
+        return export.streaming_response(kind, queryset, format)
+    action.__name__ = f'export_{format}'
+    action.short_description = f'Выгрузить в {format.upper()}'
+    return action
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -9,6 +23,14 @@ class PostAdmin(admin.ModelAdmin):
     search_fields = ('text',)
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
+    actions = [export_action('posts', 'csv'), export_action('posts', 'jsonl')]
+
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск идёт по полнотекстовому индексу вместо LIKE '%...%'.
+        if not search_term:
+            return queryset, False
+        post_ids, _ = search.search(search_term, limit=SEARCH_LIMIT)
+        return queryset.filter(pk__in=post_ids), False
 
 
 class GroupAdmin(admin.ModelAdmin):
@@ -21,8 +43,23 @@ class CommentAdmin(admin.ModelAdmin):
     list_display = ('pk', 'post', 'author', 'text', 'created')
     search_fields = ('post',)
     empty_value_display = '-пусто-'
+    actions = [
+        export_action('comments', 'csv'),
+        export_action('comments', 'jsonl'),
+    ]
+
+
+class FollowAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'user', 'author')
+    list_select_related = ('user', 'author')
+    search_fields = ('user__username', 'author__username')
+    actions = [
+        export_action('follows', 'csv'),
+        export_action('follows', 'jsonl'),
+    ]
 
 
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group, GroupAdmin)
 admin.site.register(Comment, CommentAdmin)
+admin.site.register(Follow, FollowAdmin)
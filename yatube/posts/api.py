@@ -0,0 +1,262 @@
+"""JSON-версии лент для мобильных клиентов.
+
+Строки выбираются через values(), без создания объектов моделей. Ответы
+снабжаются ETag из поколений лент (см. feed_cache) и Last-Modified по
+самой свежей записи, поэтому повторный опрос без изменений получает
+304 Not Modified и не выполняет основной запрос ленты.
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db.models import Max
+from django.http import Http404, JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_safe
+from yatube.settings import posts_per_page
+
+from . import feed_cache, groups, timeline
+from .feed_cache import (GLOBAL, author_scope, follow_scope, group_id_scope,
+                         group_scope, post_scope, user_scope)
+from .models import Comment, Post, User
+from .paginators import ChronologicalPaginator, CursorPaginator
+
+POST_FIELDS = (
+    'id',
+    'text',
+    'pub_date',
+    'author__username',
+    'author__first_name',
+    'author__last_name',
+    'group__slug',
+    'comment_count',
+    'image',
+)
+
+
+def serialize_post(row):
+    full_name = f"{row['author__first_name']} {row['author__last_name']}"
+    return {
+        'id': row['id'],
+        'text': row['text'],
+        'pub_date': row['pub_date'],
+        'author': row['author__username'],
+        'author_name': full_name.strip(),
+        'group': row['group__slug'],
+        'comment_count': row['comment_count'],
+        'image': default_storage.url(row['image']) if row['image'] else None,
+    }
+
+
+def feed_response(request, post_list, **extra):
+    paginator = CursorPaginator(post_list.values(*POST_FIELDS), posts_per_page)
+    page = paginator.get_cursor_page(request.GET.get('cursor'))
+    return JsonResponse({
+        **extra,
+        'results': [serialize_post(row) for row in page],
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    })
+
+
+def conditional_feed(*scopes, last_modified, related_scopes=None):
+    """Отвечает 304, если лента не менялась с прошлого запроса клиента.
+
+    scopes заполняются так же, как в feed_cache.cache_feed, а
+    last_modified(request, **kwargs) возвращает дату последнего изменения.
+    related_scopes(request, **kwargs) добавляет области, которые нельзя
+    вывести из адреса (автор и группа поста); None от неё значит, что
+    объекта нет, и тогда view отвечает сама.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            viewer = request.user.pk if request.user.is_authenticated else 0
+            names = [
+                scope.format(user_id=viewer, **kwargs) for scope in scopes
+            ]
+            if related_scopes is not None:
+                related = related_scopes(request, **kwargs)
+                if related is None:
+                    return view(request, *args, **kwargs)
+                names += related
+            # Поколения читаются до дат: после них запрос читает из
+            # основной базы, а не с реплики.
+            generations = feed_cache.get_generations(names)
+            modified = last_modified(request, **kwargs)
+            version = ':'.join([
+                request.get_full_path(),
+                str(viewer),
+                str(modified),
+                *generations,
+            ])
+            etag = quote_etag(hashlib.md5(version.encode()).hexdigest())
+            timestamp = modified.timestamp() if modified else None
+            response = get_conditional_response(
+                request, etag=etag, last_modified=timestamp
+            )
+            if response is None:
+                response = view(request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                response['ETag'] = etag
+                if timestamp is not None:
+                    response['Last-Modified'] = http_date(timestamp)
+            return response
+        return wrapper
+    return decorator
+
+
+def latest(post_list):
+    return post_list.aggregate(latest=Max('pub_date'))['latest']
+
+
+def api_login_required(view):
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse(
+                {'detail': 'Требуется авторизация'}, status=401
+            )
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+@require_safe
+@conditional_feed(
+    GLOBAL,
+    last_modified=lambda request: latest(Post.objects.all())
+)
+def index(request):
+    return feed_response(request, Post.objects.all())
+
+
+@require_safe
+@conditional_feed(
+    group_scope('{slug}'),
+    last_modified=lambda request, slug: latest(
+        Post.objects.filter(group__slug=slug)
+    )
+)
+def group_posts(request, slug):
+    group = groups.get_group_or_404(slug)
+    return feed_response(
+        request, Post.objects.filter(group_id=group.pk), group={
+            'slug': group.slug,
+            'title': group.title,
+            'description': group.description,
+        }
+    )
+
+
+@require_safe
+@conditional_feed(
+    author_scope('{username}'),
+    last_modified=lambda request, username: latest(
+        Post.objects.filter(author__username=username)
+    )
+)
+def profile(request, username):
+    author = User.objects.filter(username=username).values(
+        'username',
+        'first_name',
+        'last_name',
+        'stats__post_count',
+        'stats__follower_count',
+        'stats__following_count',
+    ).first()
+    if author is None:
+        raise Http404
+    return feed_response(
+        request, Post.objects.filter(author__username=username), author={
+            'username': author['username'],
+            'name': f"{author['first_name']} {author['last_name']}".strip(),
+            'post_count': author['stats__post_count'] or 0,
+            'follower_count': author['stats__follower_count'] or 0,
+            'following_count': author['stats__following_count'] or 0,
+        }
+    )
+
+
+def serialize_comment(row):
+    return {
+        'id': row['id'],
+        'text': row['text'],
+        'created': row['created'],
+        'author': row['author__username'],
+    }
+
+
+def comment_page(request, post_id):
+    comments = Comment.objects.filter(post_id=post_id).values(
+        'id', 'text', 'created', 'author__username'
+    )
+    paginator = ChronologicalPaginator(comments, settings.COMMENTS_PER_PAGE)
+    return paginator.get_cursor_page(request.GET.get('cursor'))
+
+
+def post_last_modified(request, post_id):
+    dates = Post.objects.filter(pk=post_id).aggregate(
+        published=Max('pub_date'),
+        commented=Max('comments__created'),
+    )
+    return max(filter(None, dates.values()), default=None)
+
+
+def post_related_scopes(request, post_id):
+    """Области автора и группы поста: их данные есть в ответе."""
+    post = Post.objects.filter(pk=post_id).values(
+        'author_id', 'group_id'
+    ).first()
+    if post is None:
+        return None
+    scopes = [user_scope(post['author_id'])]
+    if post['group_id'] is not None:
+        scopes.append(group_id_scope(post['group_id']))
+    return scopes
+
+
+@require_safe
+@conditional_feed(
+    post_scope('{post_id}'),
+    last_modified=post_last_modified,
+    related_scopes=post_related_scopes
+)
+def post_detail(request, post_id):
+    post = Post.objects.filter(pk=post_id).values(*POST_FIELDS).first()
+    if post is None:
+        raise Http404
+    comments = comment_page(request, post_id)
+    return JsonResponse({
+        **serialize_post(post),
+        'comments': [serialize_comment(row) for row in comments],
+        'comments_next': comments.next_cursor,
+    })
+
+
+@require_safe
+@conditional_feed(
+    post_scope('{post_id}'),
+    last_modified=post_last_modified,
+    related_scopes=post_related_scopes
+)
+def post_comments(request, post_id):
+    if not Post.objects.filter(pk=post_id).exists():
+        raise Http404
+    comments = comment_page(request, post_id)
+    return JsonResponse({
+        'results': [serialize_comment(row) for row in comments],
+        'next': comments.next_cursor,
+    })
+
+
+@require_safe
+@api_login_required
+@conditional_feed(
+    GLOBAL,
+    follow_scope('{user_id}'),
+    last_modified=lambda request: latest(timeline.follow_feed(request.user))
+)
+def follow_index(request):
+    return feed_response(request, timeline.follow_feed(request.user))
@@ -0,0 +1,91 @@
+"""Кешированные сведения об авторах для профиля и кнопки подписки.
+
+Сводка автора (имя, счётчики постов и подписок) хранится в кеше лент
+под поколением области автора, а множество авторов, на которых подписан
+читатель, — под поколением его ленты подписок (см. feed_cache). Сигналы
+постов, подписок и пользователей уже меняют эти поколения, поэтому
+отдельная инвалидация не нужна.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from django.http import Http404
+
+from . import feed_cache
+from .models import Follow, User, UserStats
+
+USER_FIELDS = ('id', 'username', 'first_name', 'last_name')
+STATS_FIELDS = ('post_count', 'follower_count', 'following_count')
+
+
+def _cache():
+    return caches[settings.FEED_CACHE_ALIAS]
+
+
+def _key(prefix, scope):
+    generation, = feed_cache.get_generations([scope])
+    return '{}:{}:{}'.format(
+        prefix, hashlib.md5(scope.encode()).hexdigest(), generation
+    )
+
+
+def _load_summary(username):
+    row = User.objects.filter(username=username).values(
+        *USER_FIELDS, *(f'stats__{field}' for field in STATS_FIELDS)
+    ).first()
+    if row is None:
+        return None
+    summary = {field: row[field] for field in USER_FIELDS}
+    for field in STATS_FIELDS:
+        # У пользователей, созданных в обход сигналов, строки stats нет.
+        summary[field] = row[f'stats__{field}'] or 0
+    return summary
+
+
+def get_author(username):
+    """Автор с заполненными stats или None, без запросов при попадании."""
+    key = _key('author-summary', feed_cache.author_scope(username))
+    cache = _cache()
+    summary = cache.get(key)
+    if summary is None:
+        summary = _load_summary(username)
+        if summary is None:
+            return None
+        cache.set(key, summary, settings.FEED_CACHE_TIMEOUT)
+    # Объекты собираются как загруженные из базы: остальные поля
+    # пользователя отложены и подгрузятся только при обращении.
+    author = User.from_db(
+        DEFAULT_DB_ALIAS, USER_FIELDS,
+        [summary[field] for field in USER_FIELDS]
+    )
+    author.stats = UserStats.from_db(
+        DEFAULT_DB_ALIAS, ('user_id', *STATS_FIELDS),
+        [summary['id'], *(summary[field] for field in STATS_FIELDS)]
+    )
+    return author
+
+
+def get_author_or_404(username):
+    author = get_author(username)
+    if author is None:
+        raise Http404('Пользователь не найден')
+    return author
+
+
+def followed_authors(user):
+    """Множество id авторов, на которых подписан пользователь."""
+    if not user.is_authenticated:
+        return frozenset()
+    key = _key('followed-authors', feed_cache.follow_scope(user.pk))
+    cache = _cache()
+    authors = cache.get(key)
+    if authors is None:
+        authors = frozenset(
+            Follow.objects.filter(user=user).values_list(
+                'author_id', flat=True
+            )
+        )
+        cache.set(key, authors, settings.FEED_CACHE_TIMEOUT)
+    return authors
@@ -0,0 +1,166 @@
+"""Приём комментариев: ограничение частоты и пакетная запись.
+
+Каждому пользователю выделяется ведро из COMMENT_RATE_BURST жетонов,
+которое пополняется на один жетон за COMMENT_RATE_SECONDS; состояние
+ведра хранится в кеше RATE_LIMIT_CACHE_ALIAS, общем для всех процессов.
+
+Если COMMENT_BUFFER_SECONDS больше нуля, комментарии не пишутся в базу
+по одному, а копятся в памяти процесса и сбрасываются одним bulk_create
+раз в интервал. Сигналы при этом не срабатывают, поэтому счётчики
+комментариев и поколения лент обновляются здесь же. Дата комментария
+в этом режиме — момент сброса, а не отправки.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+
+from . import counters, feed_cache, groups
+from .models import Comment, Post, User
+
+logger = logging.getLogger(__name__)
+
+_buffer = []
+_lock = threading.Lock()
+_timer = None
+
+
+def allow(user_id):
+    """Забирает жетон из ведра пользователя, False — если ведро пусто."""
+    cache = caches[settings.RATE_LIMIT_CACHE_ALIAS]
+    key = f'comment-bucket:{user_id}'
+    burst = settings.COMMENT_RATE_BURST
+    refill = settings.COMMENT_RATE_SECONDS
+    now = time.time()
+    tokens, updated = cache.get(key, (burst, now))
+    tokens = min(burst, tokens + (now - updated) / refill)
+    allowed = tokens >= 1
+    if allowed:
+        tokens -= 1
+    # Гонка двух запросов одного пользователя может выдать лишний
+    # жетон; для защиты от потока комментариев этого достаточно.
+    cache.set(key, (tokens, now), burst * refill)
+    return allowed
+
+
+def retry_after(user_id):
+    """Секунды до появления следующего жетона."""
+    cache = caches[settings.RATE_LIMIT_CACHE_ALIAS]
+    tokens, updated = cache.get(
+        f'comment-bucket:{user_id}', (settings.COMMENT_RATE_BURST, 0)
+    )
+    missing = max(0, 1 - tokens) * settings.COMMENT_RATE_SECONDS
+    return max(0, int(updated + missing - time.time()) + 1)
+
+
+def post_exists(post_id):
+    return Post.objects.filter(pk=post_id).exists()
+
+
+def submit(comment):
+    """Сохраняет комментарий сразу или ставит его в очередь на запись."""
+    if not settings.COMMENT_BUFFER_SECONDS:
+        with transaction.atomic():
+            comment.save()
+        return
+    with _lock:
+        _buffer.append(comment)
+        _schedule()
+
+
+def _schedule():
+    global _timer
+    if _timer is None:
+        _timer = threading.Timer(
+            settings.COMMENT_BUFFER_SECONDS, _flush_in_background
+        )
+        _timer.daemon = True
+        _timer.start()
+
+
+def flush():
+    """Записывает накопленные комментарии, возвращает их число.
+
+    Если запись не удалась, комментарии возвращаются в очередь и будут
+    записаны при следующем сбросе.
+    """
+    global _timer
+    with _lock:
+        batch = _buffer[:]
+        _buffer.clear()
+        if _timer is not None:
+            # При ручном сбросе таймер больше не нужен.
+            _timer.cancel()
+        _timer = None
+    if not batch:
+        return 0
+    try:
+        return _write(batch)
+    except Exception:
+        with _lock:
+            _buffer[:0] = batch
+            _schedule()
+        raise
+
+
+def _write(batch):
+    with transaction.atomic():
+        # Пост или автора могли удалить, пока комментарий ждал в очереди.
+        posts = set(Post.objects.filter(
+            pk__in={comment.post_id for comment in batch}
+        ).values_list('pk', flat=True))
+        authors = set(User.objects.filter(
+            pk__in={comment.author_id for comment in batch}
+        ).values_list('pk', flat=True))
+        batch = [
+            comment for comment in batch
+            if comment.post_id in posts and comment.author_id in authors
+        ]
+        if not batch:
+            return 0
+        Comment.objects.bulk_create(batch)
+        after_insert(batch)
+    return len(batch)
+
+
+def _flush_in_background():
+    try:
+        flush()
+    except Exception:
+        logger.exception('Не удалось записать комментарии')
+    finally:
+        connection.close()
+
+
+def after_insert(comments):
+    """То, что для одиночного комментария делают сигналы post_save."""
+    per_post = Counter(comment.post_id for comment in comments)
+    for post_id, count in per_post.items():
+        counters.change_comment_count(post_id, count)
+    posts = Post.objects.filter(pk__in=per_post).values_list(
+        'pk', 'author_id', 'group_id'
+    )
+    by_group_id = groups.get_directory().by_id
+    scopes = [feed_cache.GLOBAL]
+    author_ids = set()
+    for post_id, author_id, group_id in posts:
+        scopes.append(feed_cache.post_scope(post_id))
+        author_ids.add(author_id)
+        if group_id in by_group_id:
+            scopes.append(feed_cache.group_scope(by_group_id[group_id].slug))
+    scopes += [
+        feed_cache.author_scope(username) for username in
+        User.objects.filter(pk__in=author_ids).values_list(
+            'username', flat=True
+        )
+    ]
+    feed_cache.bump(*scopes)
+
+
+# Комментарии из очереди не теряются при штатной остановке процесса.
+atexit.register(flush)
@@ -0,0 +1,90 @@
+"""Денормализованные счётчики постов, комментариев и подписок.
+
+Счётчики меняются выражениями F() одним UPDATE, поэтому параллельные
+запросы не теряют инкременты. Расхождения исправляет команда
+recount_counters.
+"""
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from . import feed_cache, timeline
+from .models import Comment, Follow, Post, User, UserStats
+
+
+def change_user_stats(user_id, **deltas):
+    updates = {
+        field: F(field) + delta for field, delta in deltas.items()
+    }
+    if UserStats.objects.filter(user_id=user_id).update(**updates):
+        return
+    if all(delta > 0 for delta in deltas.values()):
+        # Строки может не быть у пользователей, созданных в обход
+        # сигналов; при удалении её не создаём, чтобы не мешать каскаду.
+        UserStats.objects.get_or_create(user_id=user_id)
+        UserStats.objects.filter(user_id=user_id).update(**updates)
+
+
+def change_comment_count(post_id, delta):
+    Post.objects.filter(pk=post_id).update(
+        comment_count=F('comment_count') + delta
+    )
+
+
+def _count(queryset, field):
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field: OuterRef('pk')}).order_by().values(
+                field
+            ).annotate(total=Count('pk')).values('total')
+        ),
+        0
+    )
+
+
+def recount():
+    """Пересчитывает все счётчики, возвращает число исправленных строк."""
+    missing = User.objects.filter(stats__isnull=True).values_list(
+        'pk', flat=True
+    )
+    UserStats.objects.bulk_create(
+        (UserStats(user_id=pk) for pk in missing),
+        batch_size=500
+    )
+    repaired = UserStats.objects.annotate(
+        real_posts=_count(Post.objects.all(), 'author'),
+        real_followers=_count(Follow.objects.all(), 'author'),
+        real_following=_count(Follow.objects.all(), 'user'),
+    ).exclude(
+        post_count=F('real_posts'),
+        follower_count=F('real_followers'),
+        following_count=F('real_following'),
+    ).values_list('pk', flat=True)
+    repaired = list(repaired)
+    repaired_users = UserStats.objects.filter(pk__in=repaired).update(
+        post_count=_count(Post.objects.all(), 'author'),
+        follower_count=_count(Follow.objects.all(), 'author'),
+        following_count=_count(Follow.objects.all(), 'user'),
+    )
+    # Сводки авторов в кеше (см. authors) хранятся под поколением автора.
+    feed_cache.bump(*(
+        feed_cache.author_scope(username) for username in
+        User.objects.filter(pk__in=repaired).values_list(
+            'username', flat=True
+        )
+    ))
+    # Автор с исправленным числом подписчиков мог перестать быть
+    # популярным, а его посты не разложены по лентам.
+    for pk in repaired:
+        timeline.backfill_author(pk)
+    repaired_posts = Post.objects.annotate(
+        real_comments=_count(Comment.objects.all(), 'post')
+    ).exclude(comment_count=F('real_comments')).values_list('pk', flat=True)
+    repaired_posts = list(repaired_posts)
+    Post.objects.filter(pk__in=repaired_posts).update(
+        comment_count=_count(Comment.objects.all(), 'post')
+    )
+    # Страница поста и карточки кешируются под поколением поста.
+    feed_cache.bump(*(
+        feed_cache.post_scope(pk) for pk in repaired_posts
+    ))
+    return repaired_users, len(repaired_posts)
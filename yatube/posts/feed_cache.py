@@ -0,0 +1,139 @@
+"""Кеш страниц лент с мгновенной инвалидацией.
+
+Ключ закешированной страницы включает текущие поколения всех лент, от
+которых она зависит: общей, группы, автора, подписок пользователя. Запись
+в базу меняет поколения затронутых лент, и старые страницы просто
+перестают находиться в кеше, поэтому их можно хранить долго.
+"""
+import hashlib
+import time
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from core import db_router
+
+GLOBAL = 'global'
+
+
+def group_scope(slug):
+    return f'group:{slug}'
+
+
+def author_scope(username):
+    return f'author:{username}'
+
+
+def follow_scope(user_id):
+    return f'follow:{user_id}'
+
+
+def post_scope(post_id):
+    return f'post:{post_id}'
+
+
+def user_scope(user_id):
+    return f'user:{user_id}'
+
+
+def group_id_scope(group_id):
+    return f'group-id:{group_id}'
+
+
+def _cache():
+    return caches[settings.FEED_CACHE_ALIAS]
+
+
+def _generations_cache():
+    # Поколения читаются из общего кеша в обход локального уровня,
+    # иначе другие процессы узнали бы об инвалидации с опозданием.
+    return caches[settings.FEED_GENERATION_CACHE_ALIAS]
+
+
+def _generation_key(scope):
+    # Слаги и имена пользователей могут содержать символы,
+    # недопустимые в ключах memcached.
+    return 'feed-generation:' + hashlib.md5(scope.encode()).hexdigest()
+
+
+def _new_generation():
+    # Время смены поколения нужно get_generations, поэтому оно входит
+    # в значение.
+    return '{:x}.{}'.format(int(time.time()), uuid.uuid4().hex)
+
+
+def _is_recent(generation):
+    stamp, _, _ = generation.partition('.')
+    try:
+        changed = int(stamp, 16)
+    except ValueError:
+        return True
+    return time.time() - changed < settings.REPLICA_STICKY_SECONDS
+
+
+def get_generations(scopes):
+    keys = [_generation_key(scope) for scope in scopes]
+    cache = _generations_cache()
+    generations = cache.get_many(keys)
+    missing = {
+        key: _new_generation() for key in keys if key not in generations
+    }
+    if missing:
+        # Потерянное поколение заменяется новым значением, поэтому
+        # страницы, собранные до вытеснения ключа, больше не найдутся.
+        cache.set_many(missing, timeout=None)
+        generations.update(missing)
+    result = [generations[key] for key in keys]
+    if any(_is_recent(generation) for generation in result):
+        # Реплика могла ещё не получить запись, сменившую поколение, и
+        # старые данные легли бы в кеш под новым поколением.
+        db_router.use_primary()
+    return result
+
+
+def bump(*scopes):
+    """Делает устаревшими все страницы, зависящие от scopes.
+
+    Возвращает новые поколения по областям.
+    """
+    generations = {scope: _new_generation() for scope in set(scopes)}
+    _generations_cache().set_many(
+        {
+            _generation_key(scope): generation
+            for scope, generation in generations.items()
+        },
+        timeout=None
+    )
+    return generations
+
+
+def cache_feed(*scopes):
+    """Кеширует ответ view с учётом поколений перечисленных лент.
+
+    Области задаются шаблонами, которые заполняются аргументами view
+    и user_id текущего пользователя: cache_feed('group:{slug}').
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            viewer = request.user.pk if request.user.is_authenticated else 0
+            names = [
+                scope.format(user_id=viewer, **kwargs) for scope in scopes
+            ]
+            path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+            key = 'feed-page:{}:{}:{}:{}'.format(
+                view.__name__, path, viewer,
+                ':'.join(get_generations(names))
+            )
+            cache = _cache()
+            response = cache.get(key)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code == 200 and not response.cookies:
+                    cache.set(key, response, settings.FEED_CACHE_TIMEOUT)
+            return response
+        return wrapper
+    return decorator
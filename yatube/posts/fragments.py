@@ -0,0 +1,77 @@
+"""Кеш отрисованных карточек постов.
+
+Ленты выбирают из базы только id, дату, автора, группу и картинку поста,
+а HTML карточек берут из кеша одним get_many. Ключ карточки включает
+поколения поста, его автора и группы (см. feed_cache), поэтому правка
+или удаление поста, смена имени автора и переименование группы сразу
+делают старую карточку недоступной. Полные объекты загружаются одним
+запросом только для карточек, которых нет в кеше.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from . import feed_cache, groups
+from .models import Post
+from .templatetags.post_thumbnails import post_thumbnail
+
+CARD_TEMPLATE = 'posts/includes/post_list.html'
+
+
+def card_scopes(post):
+    scopes = [
+        feed_cache.post_scope(post.pk),
+        feed_cache.user_scope(post.author_id),
+    ]
+    if post.group_id is not None:
+        scopes.append(feed_cache.group_id_scope(post.group_id))
+    return scopes
+
+
+def attach_cards(posts, show_author=True):
+    """Добавляет постам атрибут card с HTML карточки.
+
+    Возвращает список постов, в котором объекты для некешированных
+    карточек заменены полностью загруженными.
+    """
+    posts = list(posts)
+    if not posts:
+        return posts
+    scopes = sorted({scope for post in posts for scope in card_scopes(post)})
+    generations = dict(zip(scopes, feed_cache.get_generations(scopes)))
+    keys = {}
+    for post in posts:
+        version = ':'.join(generations[scope] for scope in card_scopes(post))
+        keys[post.pk] = 'post-card:{}:{}:{}'.format(
+            int(show_author), post.pk,
+            hashlib.md5(version.encode()).hexdigest()
+        )
+    cache = caches[settings.FEED_CACHE_ALIAS]
+    found = cache.get_many(keys.values())
+    missing = [post.pk for post in posts if keys[post.pk] not in found]
+    loaded = Post.objects.for_feed().in_bulk(missing) if missing else {}
+    groups.attach_groups(loaded.values())
+    rendered = {}
+    result = []
+    for post in posts:
+        html = found.get(keys[post.pk])
+        if html is None:
+            post = loaded.get(post.pk)
+            if post is None:
+                # Пост удалили между выборкой страницы и загрузкой.
+                continue
+            html = render_to_string(
+                CARD_TEMPLATE, {'post': post, 'show_author': show_author}
+            )
+            # Карточку с заглушкой вместо ещё не готовой миниатюры
+            # не кешируем, иначе заглушка останется до правки поста.
+            if not post.image or post_thumbnail(post.image):
+                rendered[keys[post.pk]] = html
+        post.card = mark_safe(html)
+        result.append(post)
+    if rendered:
+        cache.set_many(rendered, settings.FEED_CACHE_TIMEOUT)
+    return result
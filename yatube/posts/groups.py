@@ -0,0 +1,56 @@
+"""Справочник групп в памяти процесса.
+
+Групп немного, и меняются они редко, поэтому все строки Group держатся
+в памяти по id и по слагу. Актуальность проверяется по поколению области
+DIRECTORY_SCOPE в кеше (см. feed_cache): сохранение или удаление группы
+меняет поколение, и каждый процесс перечитывает справочник одним
+запросом при следующем обращении.
+"""
+from collections import namedtuple
+
+from django.http import Http404
+
+from . import feed_cache
+from .models import Group
+
+DIRECTORY_SCOPE = 'groups'
+
+Directory = namedtuple('Directory', 'version by_id by_slug')
+
+_directory = Directory(None, {}, {})
+
+
+def get_directory():
+    global _directory
+    version, = feed_cache.get_generations([DIRECTORY_SCOPE])
+    directory = _directory
+    if directory.version != version:
+        groups = list(Group.objects.all())
+        directory = Directory(
+            version,
+            {group.pk: group for group in groups},
+            {group.slug: group for group in groups},
+        )
+        _directory = directory
+    return directory
+
+
+def invalidate():
+    feed_cache.bump(DIRECTORY_SCOPE)
+
+
+def get_group_or_404(slug):
+    group = get_directory().by_slug.get(slug)
+    if group is None:
+        raise Http404('Группа не найдена')
+    return group
+
+
+def attach_groups(posts):
+    """Подставляет постам группы из справочника вместо запросов к базе."""
+    by_id = get_directory().by_id
+    for post in posts:
+        group = by_id.get(post.group_id)
+        if group is not None:
+            post.group = group
+    return posts
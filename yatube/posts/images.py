@@ -0,0 +1,119 @@
+"""Обработка загруженных картинок постов.
+
+Оригинал с телефона может весить десятки мегабайт, а sorl-thumbnail
+декодировал бы его целиком при каждой новой миниатюре. Поэтому при
+загрузке картинка уменьшается до IMAGE_MAX_SIZE по большей стороне,
+перекодируется в прогрессивный JPEG или WebP без EXIF, и хранится уже
+она. JPEG декодируется сразу в уменьшенном масштабе (draft), другие
+форматы больше IMAGE_MAX_PIXELS не декодируются вовсе, а уменьшение
+идёт через reduce, поэтому память на одну картинку ограничена.
+Обработка идёт в ограниченном пуле потоков с таймаутом: Pillow
+отпускает GIL при декодировании и кодировании.
+"""
+import hashlib
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from PIL import Image, ImageOps
+
+EXTENSIONS = {'JPEG': 'jpg', 'WEBP': 'webp'}
+# Результат до мегабайта остаётся в памяти, больше — уходит на диск.
+SPOOL_SIZE = 1024 * 1024
+
+_executor = None
+
+
+def _executor_instance():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_WORKERS,
+            thread_name_prefix='images'
+        )
+    return _executor
+
+
+def _flatten(image):
+    if image.mode in ('RGBA', 'LA') or 'transparency' in image.info:
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def process(path):
+    """Уменьшает и перекодирует картинку, возвращает (файл, sha256)."""
+    size = settings.IMAGE_MAX_SIZE
+    image_format = settings.IMAGE_FORMAT
+    with Image.open(path) as image:
+        # Для JPEG декодер сразу уменьшает картинку в 2-8 раз.
+        image.draft('RGB', (size, size))
+        width, height = image.size
+        if width * height > settings.IMAGE_MAX_PIXELS:
+            raise ValueError('Слишком большая картинка')
+        image = ImageOps.exif_transpose(image)
+        if image_format == 'JPEG':
+            image = _flatten(image)
+        elif image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA')
+        image.thumbnail((size, size), Image.LANCZOS, reducing_gap=2.0)
+        output = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+        # Метаданные не передаются, поэтому EXIF с геометкой не попадает
+        # в сохранённый файл.
+        image.save(
+            output, image_format, quality=settings.IMAGE_QUALITY,
+            optimize=True, progressive=True
+        )
+    output.seek(0)
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: output.read(64 * 1024), b''):
+        digest.update(chunk)
+    output.seek(0)
+    return output, digest.hexdigest()
+
+
+def _spool_to_disk(upload):
+    if hasattr(upload, 'temporary_file_path'):
+        return upload.temporary_file_path(), False
+    with tempfile.NamedTemporaryFile(delete=False) as source:
+        for chunk in upload.chunks():
+            source.write(chunk)
+    return source.name, True
+
+
+def ingest(upload):
+    """Обрабатывает загруженный файл, возвращает File для ImageField.
+
+    Хеш содержимого доступен в атрибуте content_hash.
+    """
+    path, temporary = _spool_to_disk(upload)
+    try:
+        return ingest_path(path)
+    finally:
+        if temporary:
+            os.remove(path)
+
+
+def ingest_path(path):
+    """То же, что ingest, для файла на диске."""
+    future = _executor_instance().submit(process, path)
+    try:
+        output, digest = future.result(timeout=settings.IMAGE_TIMEOUT)
+    except FutureTimeout:
+        raise ValidationError(
+            'Картинка обрабатывается слишком долго', code='timeout'
+        )
+    except (OSError, ValueError, Image.DecompressionBombError):
+        raise ValidationError(
+            'Не удалось обработать картинку', code='invalid_image'
+        )
+    extension = EXTENSIONS[settings.IMAGE_FORMAT]
+    image = File(output, name=f'{digest[:32]}.{extension}')
+    image.content_hash = digest
+    return image
@@ -0,0 +1,283 @@
+"""Пакетный импорт постов из JSON Lines.
+
+Каждая строка — объект с полями text, author (имя пользователя) и
+необязательными group (слаг), pub_date (ISO 8601) и image (путь к
+локальному файлу). Картинки обрабатываются и сохраняются так же, как
+загруженные через PostForm (posts.images, core.storage). Строки
+проверяются пачками по правилам PostForm,
+авторы и группы берутся из словарей в памяти, посты пишутся bulk_create
+в транзакции на пачку. После каждой пачки номер строки сохраняется в
+файл контрольной точки, и прерванный импорт продолжается с него.
+"""
+import json
+import os
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import counters, feed_cache, images, search, thumbnails, timeline
+from .forms import PostForm
+from .models import Follow, Group, Post, TimelineEntry, User, UserStats
+from .seeding import explicit_dates
+
+
+class RowError(Exception):
+    pass
+
+
+def prepare_image(path):
+    """Уменьшает и перекодирует картинку, как при загрузке через форму."""
+    try:
+        return images.ingest_path(path)
+    except ValidationError as error:
+        raise RowError(f'{path}: ' + ' '.join(error.messages))
+
+
+def store_image(image):
+    field = Post._meta.get_field('image')
+    with image:
+        return field.storage.save(
+            field.generate_filename(None, image.name), image
+        )
+
+
+class Checkpoint:
+    """Номер последней строки, записанной в базу."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        if self.path is None or not os.path.exists(self.path):
+            return 0
+        with open(self.path) as checkpoint:
+            return json.load(checkpoint)['line']
+
+    def save(self, line):
+        if self.path is None:
+            return
+        temporary = f'{self.path}.tmp'
+        with open(temporary, 'w') as checkpoint:
+            json.dump({'line': line}, checkpoint)
+        os.replace(temporary, self.path)
+
+    def clear(self):
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class PostImporter:
+    def __init__(self, batch_size=500, workers=4, create_authors=False,
+                 checkpoint=None):
+        self.batch_size = batch_size
+        self.workers = workers
+        self.create_authors = create_authors
+        self.checkpoint = Checkpoint(checkpoint)
+        self.authors = {}
+        self.groups = {
+            slug: (pk, title)
+            for pk, slug, title in Group.objects.values_list(
+                'pk', 'slug', 'title'
+            )
+        }
+        self.text_field = PostForm.base_fields['text']
+        self.imported = 0
+        self.errors = []
+
+    def run(self, lines, progress=None):
+        """Импортирует строки, возвращает число записанных постов."""
+        start = self.checkpoint.load()
+        batch = []
+        started = time.perf_counter()
+        for number, line in enumerate(lines, 1):
+            if number <= start or not line.strip():
+                continue
+            batch.append((number, line))
+            if len(batch) == self.batch_size:
+                self.import_batch(batch)
+                batch = []
+                if progress is not None:
+                    progress(self.imported, time.perf_counter() - started)
+        if batch:
+            self.import_batch(batch)
+        self.checkpoint.clear()
+        return self.imported
+
+    def parse(self, batch):
+        rows = []
+        for number, line in batch:
+            try:
+                data = json.loads(line)
+                if not isinstance(data, dict):
+                    raise RowError('ожидается объект JSON')
+                rows.append((number, data))
+            except (ValueError, RowError) as error:
+                self.errors.append((number, str(error)))
+        return rows
+
+    def resolve_authors(self, rows):
+        usernames = {
+            data.get('author') for _, data in rows
+        } - set(self.authors) - {None}
+        if not usernames:
+            return
+        self.authors.update(
+            User.objects.filter(username__in=usernames).values_list(
+                'username', 'pk'
+            )
+        )
+        missing = usernames - set(self.authors)
+        if missing and self.create_authors:
+            User.objects.bulk_create(
+                User(username=username, password='!') for username in missing
+            )
+            # Строки UserStats для них создаст change_user_stats.
+            self.authors.update(
+                User.objects.filter(username__in=missing).values_list(
+                    'username', 'pk'
+                )
+            )
+
+    def validate(self, data):
+        try:
+            text = self.text_field.clean(data.get('text'))
+        except ValidationError as error:
+            raise RowError('text: ' + ' '.join(error.messages))
+        author_id = self.authors.get(data.get('author'))
+        if author_id is None:
+            raise RowError(f'неизвестный автор {data.get("author")!r}')
+        group_id = None
+        if data.get('group'):
+            if data['group'] not in self.groups:
+                raise RowError(f'неизвестная группа {data["group"]!r}')
+            group_id, _ = self.groups[data['group']]
+        pub_date = timezone.now()
+        if data.get('pub_date'):
+            pub_date = parse_datetime(data['pub_date'])
+            if pub_date is None:
+                raise RowError(f'неверная дата {data["pub_date"]!r}')
+            if timezone.is_naive(pub_date):
+                pub_date = timezone.make_aware(pub_date)
+        return Post(
+            text=text, author_id=author_id, group_id=group_id,
+            pub_date=pub_date
+        )
+
+    def import_batch(self, batch):
+        rows = self.parse(batch)
+        self.resolve_authors(rows)
+        posts, sources = [], {}
+        for number, data in rows:
+            try:
+                post = self.validate(data)
+            except RowError as error:
+                self.errors.append((number, str(error)))
+                continue
+            if data.get('image'):
+                sources[len(posts)] = (number, data['image'])
+            posts.append(post)
+        prepared = self.prepare_images(sources) if sources else {}
+        stored = []
+        try:
+            with transaction.atomic():
+                self.attach_images(posts, sources, prepared, stored)
+                self.insert(posts)
+                self.after_insert(posts)
+        except Exception:
+            # Счётчики ссылок откатились вместе с транзакцией, а файлы
+            # остались на диске.
+            for name in stored:
+                default_storage.discard(name)
+            raise
+        self.imported += len(posts)
+        self.checkpoint.save(batch[-1][0])
+
+    def prepare_images(self, sources):
+        # Pillow отпускает GIL, потоков достаточно; число одновременно
+        # обрабатываемых картинок ограничивает пул posts.images.
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            return {
+                index: pool.submit(prepare_image, path)
+                for index, (_, path) in sources.items()
+            }
+
+    def attach_images(self, posts, sources, prepared, stored):
+        # Сохраняет файлы основной поток внутри транзакции пачки:
+        # хранилище ведёт счётчики ссылок в базе.
+        failed = set()
+        for index, future in prepared.items():
+            try:
+                posts[index].image = store_image(future.result())
+            except (OSError, RowError) as error:
+                self.errors.append((sources[index][0], str(error)))
+                failed.add(index)
+            else:
+                stored.append(posts[index].image.name)
+        posts[:] = [
+            post for index, post in enumerate(posts) if index not in failed
+        ]
+
+    def insert(self, posts):
+        if not posts:
+            return
+        if not connection.features.can_return_ids_from_bulk_insert:
+            # SQLite не возвращает id из bulk_create: назначаем их сами.
+            # Транзакция SQLite берёт блокировку записи только при первой
+            # записи, поэтому берём её пустым UPDATE до чтения Max(pk):
+            # параллельная вставка дождётся конца этой транзакции.
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'UPDATE {Post._meta.db_table} SET id = id WHERE 0'
+                )
+            first = (Post.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+            for pk, post in enumerate(posts, first):
+                post.pk = pk
+        with explicit_dates():
+            Post.objects.bulk_create(posts)
+
+    def after_insert(self, posts):
+        """То, что для одиночного поста делают сигналы post_save."""
+        if not posts:
+            return
+        authors = Counter(post.author_id for post in posts)
+        for author_id, count in authors.items():
+            counters.change_user_stats(author_id, post_count=count)
+        popular = set(UserStats.objects.filter(
+            user_id__in=authors,
+            follower_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS
+        ).values_list('user_id', flat=True))
+        followers = {}
+        for author_id, user_id in Follow.objects.filter(
+            author_id__in=set(authors) - popular
+        ).values_list('author_id', 'user_id'):
+            followers.setdefault(author_id, []).append(user_id)
+        TimelineEntry.objects.bulk_create(
+            [
+                TimelineEntry(user_id=user_id, post_id=post.pk)
+                for post in posts
+                for user_id in followers.get(post.author_id, ())
+            ],
+            batch_size=timeline.BATCH_SIZE,
+            ignore_conflicts=True
+        )
+        index = search.get_index()
+        titles = {pk: title for pk, title in self.groups.values()}
+        slugs = {pk: slug for slug, (pk, _) in self.groups.items()}
+        usernames = {pk: username for username, pk in self.authors.items()}
+        scopes = [feed_cache.GLOBAL]
+        for post in posts:
+            index.index(post.pk, post.text, titles.get(post.group_id, ''))
+            if post.image:
+                thumbnails.schedule(post.image.name)
+            scopes.append(feed_cache.author_scope(usernames[post.author_id]))
+            if post.group_id is not None:
+                scopes.append(feed_cache.group_scope(slugs[post.group_id]))
+        feed_cache.bump(*scopes)
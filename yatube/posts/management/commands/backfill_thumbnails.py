@@ -0,0 +1,50 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Создаёт миниатюры для уже загруженных картинок постов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=settings.THUMBNAIL_WORKERS
+        )
+        parser.add_argument('--directory', default='posts')
+
+    def handle(self, *args, **options):
+        # Картинки лежат во вложенных каталогах по хешу (core.storage),
+        # поэтому имена берутся из постов, а не из листинга каталога.
+        names = [
+            name for name in Post.objects.filter(
+                image__startswith=options['directory'] + '/'
+            ).order_by().values_list('image', flat=True).distinct()
+            if default_storage.exists(name)
+        ]
+        started = time.monotonic()
+        failed = 0
+        # Pillow отпускает GIL при декодировании и масштабировании,
+        # поэтому потоков достаточно для загрузки всех ядер.
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            futures = {
+                pool.submit(thumbnails.generate, name): name
+                for name in names
+            }
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as error:
+                    failed += 1
+                    self.stderr.write(f'{futures[future]}: {error}')
+        thumbnails.invalidate_pages(names)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано картинок: {len(names) - failed} из {len(names)} '
+            f'за {elapsed:.1f} с'
+        ))
@@ -0,0 +1,166 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from importlib import import_module
+
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from posts.models import Group, User
+from posts.seeding import Seeder
+
+# Режим журнала хранится в файле базы, поэтому исходный профиль задаёт
+# его явно, иначе он унаследовал бы WAL от предыдущего прогона.
+DEFAULT_PROFILE = {
+    'CONN_MAX_AGE': 0,
+    'SQLITE_PRAGMAS': {'journal_mode': 'DELETE', 'synchronous': 'FULL'},
+}
+
+
+def production_profile():
+    # Модуль требует секретный ключ, хотя для замера он не нужен.
+    os.environ.setdefault('YATUBE_SECRET_KEY', 'bench-concurrency')
+    production = import_module('yatube.settings_production')
+    return {
+        'CONN_MAX_AGE': production.DATABASES['default']['CONN_MAX_AGE'],
+        'SQLITE_PRAGMAS': production.SQLITE_PRAGMAS,
+    }
+
+
+class Worker(threading.Thread):
+    def __init__(self, urls, user, deadline):
+        super().__init__()
+        self.urls = urls
+        self.user = user
+        self.deadline = deadline
+        self.requests = 0
+        self.errors = 0
+        self.timings = []
+
+    def request(self, client, number):
+        if self.user is None:
+            url = self.urls[number % len(self.urls)]
+            return client.get(url).status_code == 200
+        response = client.post(
+            reverse('posts:post_create'), {'text': f'Пост {number}'}
+        )
+        return response.status_code == 302
+
+    def run(self):
+        client = Client()
+        if self.user is not None:
+            client.force_login(self.user)
+        number = 0
+        try:
+            while time.perf_counter() < self.deadline:
+                started = time.perf_counter()
+                try:
+                    ok = self.request(client, number)
+                except Exception:
+                    ok = False
+                self.timings.append(time.perf_counter() - started)
+                self.requests += 1
+                self.errors += not ok
+                number += 1
+        finally:
+            connection.close()
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность лент при одновременных '
+        'чтениях и записях в несколько потоков с настройками базы по '
+        'умолчанию и из settings_production.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--posts', type=int, default=20000)
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument(
+            '--duration', type=float, default=10,
+            help='Длительность прогона каждого профиля в секундах'
+        )
+        parser.add_argument('--output', help='Файл для результатов в JSON')
+
+    def handle(self, *args, **options):
+        # Потокам нужна общая база в файле: база в памяти у каждого
+        # соединения своя.
+        directory = tempfile.mkdtemp()
+        connection.settings_dict['TEST']['NAME'] = os.path.join(
+            directory, 'bench.sqlite3'
+        )
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False
+        )
+        try:
+            Seeder(
+                users=options['users'],
+                posts=options['posts'],
+                comments=0,
+            ).run()
+            results = {
+                'default': self.run_profile(DEFAULT_PROFILE, options),
+                'production': self.run_profile(production_profile(),
+                                               options),
+            }
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            os.rmdir(directory)
+        for name, result in results.items():
+            self.stdout.write(
+                '{:<11} чтений/с {reads_per_second:8.1f}  записей/с '
+                '{writes_per_second:7.1f}  ошибок {errors:>4}  '
+                'p95 {p95_ms:8.2f} мс'.format(name, **result)
+            )
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
+
+    def run_profile(self, profile, options):
+        group = Group.objects.order_by('pk').first()
+        author = User.objects.order_by('-stats__post_count').first()
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': group.slug}),
+            reverse('posts:profile', kwargs={'username': author.username}),
+        ]
+        writers = list(User.objects.order_by('pk')[:options['writers']])
+        connections.close_all()
+        connection.settings_dict['CONN_MAX_AGE'] = profile['CONN_MAX_AGE']
+        with override_settings(SQLITE_PRAGMAS=profile['SQLITE_PRAGMAS']):
+            deadline = time.perf_counter() + options['duration']
+            workers = [
+                Worker(urls, None, deadline)
+                for _ in range(options['readers'])
+            ] + [Worker(urls, user, deadline) for user in writers]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            connections.close_all()
+        # Считаются только успешные ответы.
+        readers = [worker for worker in workers if worker.user is None]
+        timings = sorted(
+            timing for worker in workers for timing in worker.timings
+        )
+        duration = options['duration']
+        return {
+            'reads_per_second': sum(
+                worker.requests - worker.errors for worker in readers
+            ) / duration,
+            'writes_per_second': sum(
+                worker.requests - worker.errors for worker in workers
+                if worker.user is not None
+            ) / duration,
+            'errors': sum(worker.errors for worker in workers),
+            'p95_ms': timings[int(len(timings) * 0.95)] * 1000
+            if timings else 0,
+        }
@@ -0,0 +1,191 @@
+import json
+import statistics
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+from yatube.settings import posts_per_page
+
+from posts.models import Group, Post, User
+from posts.paginators import NEXT, encode_cursor
+from posts.seeding import Seeder
+
+
+def count_queries(counter):
+    def wrapper(execute, sql, params, many, context):
+        counter[0] += 1
+        return execute(sql, params, many, context)
+    return wrapper
+
+
+def percentile(timings, q):
+    return timings[min(len(timings) - 1, int(len(timings) * q))]
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет отдельную базу реалистичным объёмом данных и замеряет '
+        'время ответа и число запросов лент на первой и дальних страницах.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--groups', type=int, default=100)
+        parser.add_argument('--posts', type=int, default=100000)
+        parser.add_argument('--comments', type=int, default=100000)
+        parser.add_argument(
+            '--follows', type=int, default=30,
+            help='Подписок на пользователя'
+        )
+        parser.add_argument('--depth', type=int, default=5000,
+                            help='Смещение дальней страницы в постах')
+        parser.add_argument('--repeat', type=int, default=30)
+        parser.add_argument(
+            '--warm', action='store_true',
+            help='Не очищать кеш лент перед каждым запросом'
+        )
+        parser.add_argument(
+            '--database',
+            help='Файл тестовой базы, по умолчанию база в памяти'
+        )
+        parser.add_argument(
+            '--keepdb', action='store_true',
+            help='Не удалять базу и не заполнять её повторно'
+        )
+        parser.add_argument('--output', help='Файл для результатов в JSON')
+        parser.add_argument('--baseline', help='Результаты для сравнения')
+        parser.add_argument(
+            '--tolerance', type=float, default=0.2,
+            help='Допустимый рост p95 относительно baseline'
+        )
+
+    def handle(self, *args, **options):
+        if options['database']:
+            connection.settings_dict['TEST']['NAME'] = options['database']
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False,
+            keepdb=options['keepdb']
+        )
+        try:
+            if not Post.objects.exists():
+                started = time.perf_counter()
+                Seeder(
+                    users=options['users'],
+                    groups=options['groups'],
+                    posts=options['posts'],
+                    comments=options['comments'],
+                    follows=options['follows'],
+                ).run()
+                self.stdout.write(
+                    f'База заполнена за {time.perf_counter() - started:.1f} с'
+                )
+            results = self.run_cases(options)
+        finally:
+            connection.creation.destroy_test_db(
+                old_name, verbosity=0, keepdb=options['keepdb']
+            )
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2, ensure_ascii=False)
+        if options['baseline']:
+            self.compare(results, options['baseline'], options['tolerance'])
+
+    def cases(self, depth):
+        group = Group.objects.order_by('pk').first()
+        author = User.objects.order_by('-stats__post_count').first()
+        post = Post.objects.order_by('-comment_count').first()
+        reader = User.objects.order_by('-stats__following_count').first()
+        feeds = [
+            ('index', reverse('posts:index'), Post.objects.all(), None),
+            ('group_posts',
+             reverse('posts:group_list', kwargs={'slug': group.slug}),
+             Post.objects.filter(group=group), None),
+            ('profile',
+             reverse('posts:profile', kwargs={'username': author.username}),
+             Post.objects.filter(author=author), None),
+            ('follow_index', reverse('posts:follow_index'),
+             Post.objects.filter(author__following__user=reader), reader),
+        ]
+        yield (
+            'post_detail',
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}),
+            None
+        )
+        for name, url, post_list, user in feeds:
+            yield f'{name}:first', url, user
+            deep = post_list.order_by('-pub_date', '-pk')[depth:depth + 1]
+            deep = deep.first()
+            if deep is None:
+                continue
+            cursor = encode_cursor(NEXT, deep)
+            yield f'{name}:deep', f'{url}?cursor={cursor}', user
+            page = depth // posts_per_page + 1
+            yield f'{name}:deep-offset', f'{url}?page={page}', user
+
+    def run_cases(self, options):
+        cache = caches[settings.FEED_CACHE_ALIAS]
+        results = {}
+        for name, url, user in self.cases(options['depth']):
+            client = Client()
+            if user is not None:
+                client.force_login(user)
+            timings = []
+            counter = [0]
+            for _ in range(options['repeat']):
+                if not options['warm']:
+                    cache.clear()
+                counter[0] = 0
+                with connection.execute_wrapper(count_queries(counter)):
+                    started = time.perf_counter()
+                    response = client.get(url)
+                    timings.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    raise CommandError(
+                        f'{url} вернул {response.status_code}'
+                    )
+            queries = counter[0]
+            timings.sort()
+            results[name] = {
+                'url': url,
+                'queries': queries,
+                'mean_ms': statistics.mean(timings) * 1000,
+                'p50_ms': percentile(timings, 0.5) * 1000,
+                'p95_ms': percentile(timings, 0.95) * 1000,
+                'p99_ms': percentile(timings, 0.99) * 1000,
+            }
+            self.stdout.write(
+                '{:<26} запросов {queries:>3}  p50 {p50_ms:8.2f} мс  '
+                'p95 {p95_ms:8.2f} мс  p99 {p99_ms:8.2f} мс'.format(
+                    name, **results[name]
+                )
+            )
+        return results
+
+    def compare(self, results, path, tolerance):
+        with open(path) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = []
+        for name, result in results.items():
+            before = baseline.get(name)
+            if before is None:
+                continue
+            if result['queries'] > before['queries']:
+                regressions.append(
+                    f'{name}: запросов {before["queries"]} -> '
+                    f'{result["queries"]}'
+                )
+            if result['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+                regressions.append(
+                    f'{name}: p95 {before["p95_ms"]:.2f} -> '
+                    f'{result["p95_ms"]:.2f} мс'
+                )
+        if regressions:
+            raise CommandError(
+                'Регрессии производительности:\n' + '\n'.join(regressions)
+            )
+        self.stdout.write(self.style.SUCCESS('Регрессий нет'))
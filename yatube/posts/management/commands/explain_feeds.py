@@ -0,0 +1,90 @@
+import json
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from posts.models import Comment, Follow, Group, Post, User
+from posts.seeding import Seeder
+
+BEFORE = '0010_search_index'
+AFTER = '0012_feed_order_indexes'
+
+
+class Command(BaseCommand):
+    help = (
+        'Показывает планы запросов лент и их время до и после '
+        'составных индексов на заполненной тестовой базе.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=5000)
+        parser.add_argument('--posts', type=int, default=50000)
+        parser.add_argument('--comments', type=int, default=50000)
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--output', help='Файл для результатов в JSON')
+
+    def queries(self):
+        group = Group.objects.order_by('pk').first()
+        author = User.objects.order_by('-stats__post_count').first()
+        post = Post.objects.order_by('-comment_count').first()
+        follow = Follow.objects.order_by('pk').first()
+        return {
+            'index': Post.objects.for_feed()[:11],
+            'group_posts': Post.objects.for_feed().filter(group=group)[:11],
+            'profile': Post.objects.for_feed().filter(author=author)[:11],
+            'comments': Comment.objects.filter(post=post).order_by(
+                'created'
+            )[:50],
+            'follow_exists': Follow.objects.filter(
+                user_id=follow.user_id, author_id=follow.author_id
+            )[:1],
+        }
+
+    def measure(self, repeat):
+        results = {}
+        for name, queryset in self.queries().items():
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                list(queryset.all())
+                timings.append(time.perf_counter() - started)
+            timings.sort()
+            results[name] = {
+                'plan': queryset.explain(),
+                'p50_ms': timings[len(timings) // 2] * 1000,
+            }
+        return results
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False
+        )
+        try:
+            Seeder(
+                users=options['users'],
+                posts=options['posts'],
+                comments=options['comments'],
+            ).run()
+            call_command('migrate', 'posts', BEFORE, verbosity=0)
+            before = self.measure(options['repeat'])
+            call_command('migrate', 'posts', AFTER, verbosity=0)
+            after = self.measure(options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+        for name in before:
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            for label, result in (('до', before), ('после', after)):
+                self.stdout.write(
+                    f'  {label}: {result[name]["p50_ms"]:.3f} мс'
+                )
+                for line in result[name]['plan'].splitlines():
+                    self.stdout.write(f'    {line}')
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(
+                    {'before': before, 'after': after}, output,
+                    indent=2, ensure_ascii=False
+                )
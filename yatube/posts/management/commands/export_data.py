@@ -0,0 +1,60 @@
+from argparse import ArgumentTypeError
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from posts import export
+
+
+def parse_date(value):
+    try:
+        date = datetime.fromisoformat(value)
+    except ValueError:
+        raise ArgumentTypeError(f'неверная дата: {value}')
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date)
+    return date
+
+
+class Command(BaseCommand):
+    help = 'Потоково выгружает посты, комментарии или подписки.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=export.EXPORTS)
+        parser.add_argument(
+            '--format', choices=export.FORMATS, default='csv'
+        )
+        parser.add_argument(
+            '--since', type=parse_date, help='Начало периода, ISO 8601'
+        )
+        parser.add_argument(
+            '--until', type=parse_date,
+            help='Конец периода (не включая), ISO 8601'
+        )
+        parser.add_argument('--group', help='Слаг группы')
+        parser.add_argument('--author', help='Имя пользователя автора')
+        parser.add_argument(
+            '--chunk-size', type=int, default=export.CHUNK_SIZE
+        )
+        parser.add_argument('--output', help='Файл, по умолчанию stdout')
+
+    def handle(self, *args, **options):
+        queryset = export.filter_queryset(
+            options['kind'],
+            since=options['since'],
+            until=options['until'],
+            group=options['group'],
+            author=options['author'],
+        )
+        lines = export.rows(
+            options['kind'], queryset, options['format'],
+            options['chunk_size']
+        )
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8',
+                      newline='') as output:
+                output.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
@@ -0,0 +1,62 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.importer import PostImporter
+
+
+class Command(BaseCommand):
+    help = (
+        'Импортирует посты из файла JSON Lines пачками и продолжает '
+        'с контрольной точки после сбоя.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл JSON Lines или - для stdin')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help='Потоков для копирования картинок'
+        )
+        parser.add_argument(
+            '--create-authors', action='store_true',
+            help='Создавать неизвестных авторов'
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help='Файл контрольной точки, по умолчанию <path>.checkpoint'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        checkpoint = options['checkpoint']
+        if checkpoint is None and path != '-':
+            checkpoint = f'{path}.checkpoint'
+        importer = PostImporter(
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            create_authors=options['create_authors'],
+            checkpoint=checkpoint,
+        )
+
+        def progress(imported, elapsed):
+            self.stdout.write(
+                f'Импортировано {imported} постов, '
+                f'{imported / elapsed:,.0f} постов/с'
+            )
+
+        started = time.perf_counter()
+        if path == '-':
+            imported = importer.run(sys.stdin, progress)
+        else:
+            with open(path, encoding='utf-8') as lines:
+                imported = importer.run(lines, progress)
+        elapsed = time.perf_counter() - started
+        for number, error in importer.errors:
+            self.stderr.write(f'Строка {number}: {error}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Импортировано постов: {imported}, '
+            f'пропущено строк: {len(importer.errors)}, '
+            f'{imported / elapsed:,.0f} постов/с'
+        ))
@@ -0,0 +1,156 @@
+import os
+import posixpath
+import shutil
+from collections import Counter
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core.models import StoredFile
+from core.storage import ContentAddressedStorage, file_hash
+from posts import feed_cache
+from posts.models import Post
+
+IMAGE_DIRECTORY = 'posts'
+
+
+def link(source, target):
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит картинки постов в хранилище по содержимому, объединяет '
+        'одинаковые файлы, пересчитывает ссылки и удаляет файлы, на '
+        'которые не ссылается ни один пост. Запускайте без параллельных '
+        'загрузок.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только посчитать, ничего не менять'
+        )
+        parser.add_argument(
+            '--keep-orphans', action='store_true',
+            help='Не удалять файлы без ссылок'
+        )
+
+    def handle(self, *args, **options):
+        self.storage = default_storage
+        if not isinstance(self.storage, ContentAddressedStorage):
+            raise CommandError(
+                'DEFAULT_FILE_STORAGE должно быть ContentAddressedStorage'
+            )
+        self.dry_run = options['dry_run']
+        self.freed = 0
+        renamed, duplicates = self.migrate()
+        orphans = 0
+        if not options['keep_orphans']:
+            orphans = self.remove_orphans()
+        self.stdout.write(self.style.SUCCESS(
+            f'Перенесено файлов: {len(renamed) - duplicates}, '
+            f'дубликатов: {duplicates}, файлов без ссылок: {orphans}, '
+            f'освобождено {self.freed / 1024 / 1024:.1f} МБ'
+        ))
+
+    def migrate(self):
+        names = Counter(
+            Post.objects.exclude(image='').values_list('image', flat=True)
+        )
+        stored = set(StoredFile.objects.filter(
+            name__in=names
+        ).values_list('name', flat=True))
+        renamed, sizes, created, duplicates = {}, {}, set(), 0
+        for name in set(names) - stored:
+            if not self.exists(name):
+                continue
+            with self.storage.open(name) as image:
+                target = self.target(name, file_hash(image))
+                sizes[target] = image.size
+            if target == name:
+                # Файл уже на своём месте, не хватает только строки
+                # StoredFile: её создаст recount.
+                continue
+            renamed[name] = target
+            if target in created or self.storage.exists(target):
+                duplicates += 1
+                self.freed += sizes[target]
+                continue
+            created.add(target)
+            if not self.dry_run:
+                # Старый файл удаляется только после записи в базу.
+                link(self.storage.path(name), self.storage.path(target))
+        if self.dry_run or not sizes:
+            return renamed, duplicates
+        with transaction.atomic():
+            for name, target in renamed.items():
+                Post.objects.filter(image=name).update(image=target)
+            self.recount(sizes)
+        feed_cache.bump(*(
+            feed_cache.post_scope(pk) for pk in Post.objects.filter(
+                image__in=set(renamed.values())
+            ).values_list('pk', flat=True)
+        ))
+        for name in renamed:
+            self.storage.delete(name)
+        return renamed, duplicates
+
+    def exists(self, name):
+        try:
+            return self.storage.exists(name)
+        except SuspiciousFileOperation:
+            self.stderr.write(f'Пропущен путь вне MEDIA_ROOT: {name}')
+            return False
+
+    def target(self, name, digest):
+        """Имя файла name в хранилище по содержимому."""
+        directory, filename = posixpath.split(name)
+        # Файл мог уже лежать по своему хешу: posts/ab/cd/abcd….jpg.
+        parent = posixpath.dirname(posixpath.dirname(directory))
+        if self.storage.content_name(
+            posixpath.join(parent, filename), digest
+        ) == name:
+            return name
+        return self.storage.content_name(name, digest)
+
+    def recount(self, sizes):
+        names = Counter(
+            Post.objects.exclude(image='').values_list('image', flat=True)
+        )
+        existing = set(StoredFile.objects.values_list('name', flat=True))
+        StoredFile.objects.bulk_create(
+            StoredFile(name=name, size=sizes.get(name, 0))
+            for name in set(sizes) - existing
+        )
+        StoredFile.objects.update(references=0)
+        for name, count in names.items():
+            StoredFile.objects.filter(name=name).update(references=count)
+
+    def remove_orphans(self):
+        referenced = set(
+            Post.objects.exclude(image='').values_list('image', flat=True)
+        )
+        root = self.storage.path(IMAGE_DIRECTORY)
+        orphans = 0
+        for directory, _, files in os.walk(root):
+            for filename in files:
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, self.storage.location).replace(
+                    os.sep, '/'
+                )
+                if name in referenced:
+                    continue
+                orphans += 1
+                self.freed += os.path.getsize(path)
+                if not self.dry_run:
+                    os.remove(path)
+        if not self.dry_run:
+            StoredFile.objects.filter(references__lte=0).delete()
+        return orphans
@@ -0,0 +1,63 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from posts.seeding import Seeder
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу пользователями, группами, постами, комментариями '
+        'и подписками пакетными вставками.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--comments', type=int, default=10000)
+        parser.add_argument(
+            '--follows', type=int, default=20,
+            help='Подписок на пользователя'
+        )
+        parser.add_argument(
+            '--images', type=float, default=0.0,
+            help='Доля постов с картинкой, от 0 до 1'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Процессов для создания картинок'
+        )
+        parser.add_argument(
+            '--prefix', default='seed',
+            help='Префикс имён пользователей и слагов групп'
+        )
+
+    def handle(self, *args, **options):
+        seeder = Seeder(
+            users=options['users'],
+            groups=options['groups'],
+            posts=options['posts'],
+            comments=options['comments'],
+            follows=options['follows'],
+            images=options['images'],
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            prefix=options['prefix'],
+        )
+        total_rows = total_time = 0
+        for name, rows, elapsed in seeder.run():
+            total_rows += rows
+            total_time += elapsed
+            speed = rows / elapsed if elapsed else 0
+            self.stdout.write(
+                f'{name:<10} {rows:>9} строк за {elapsed:6.2f} с '
+                f'({speed:,.0f} строк/с)'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Всего {total_rows} строк за {total_time:.1f} с '
+            f'({total_rows / total_time:,.0f} строк/с)'
+        ))
@@ -0,0 +1,136 @@
+import base64
+import binascii
+
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+def position(post, date_field='pub_date'):
+    """Ключ (дата, id) для объекта модели или строки из values()."""
+    if isinstance(post, dict):
+        return post[date_field], post['id']
+    return getattr(post, date_field), post.pk
+
+
+def encode_cursor(direction, post, date_field='pub_date'):
+    """Упаковывает позицию (дата, id) в непрозрачный токен."""
+    pub_date, pk = position(post, date_field)
+    raw = f'{direction}|{pub_date.isoformat()}|{pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Распаковывает токен, для испорченного токена возвращает None."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        direction, pub_date, pk = raw.split('|')
+        pub_date = parse_datetime(pub_date)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if direction not in (NEXT, PREVIOUS) or pub_date is None:
+        return None
+    return direction, pub_date, pk
+
+
+class CursorPaginator(Paginator):
+    """Постраничный вывод по ключу (pub_date, id).
+
+    Страница выбирается условием по индексу pub_date вместо OFFSET,
+    а COUNT(*) не выполняется, поэтому любая страница стоит столько же,
+    сколько первая.
+    """
+    is_cursor = True
+
+    def get_cursor_page(self, cursor):
+        position = decode_cursor(cursor)
+        if position is None:
+            return self._build_page(self._fetch_after(None), None, None)
+        direction, pub_date, pk = position
+        if direction == NEXT:
+            rows = self._fetch_after((pub_date, pk))
+            return self._build_page(rows, NEXT, (pub_date, pk))
+        rows = self._fetch_before((pub_date, pk))
+        if len(rows) <= self.per_page:
+            # Впереди меньше страницы записей: это начало ленты.
+            return self._build_page(self._fetch_after(None), None, None)
+        return self._build_page(rows, PREVIOUS, (pub_date, pk))
+
+    def _fetch_after(self, key):
+        queryset = self.object_list.order_by('-pub_date', '-pk')
+        if key is not None:
+            pub_date, pk = key
+            # Условие pub_date__lte избыточно, но без него SQLite не
+            # может начать поиск по индексу с позиции курсора и
+            # просматривает индекс от самой новой записи.
+            queryset = queryset.filter(
+                Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, pk__lt=pk),
+                pub_date__lte=pub_date
+            )
+        return list(queryset[:self.per_page + 1])
+
+    def _fetch_before(self, key):
+        pub_date, pk = key
+        queryset = self.object_list.filter(
+            Q(pub_date__gt=pub_date) | Q(pub_date=pub_date, pk__gt=pk),
+            pub_date__gte=pub_date
+        ).order_by('pub_date', 'pk')
+        return list(queryset[:self.per_page + 1])
+
+    def _build_page(self, rows, direction, key):
+        has_more = len(rows) > self.per_page
+        object_list = rows[:self.per_page]
+        if direction == PREVIOUS:
+            object_list.reverse()
+        page = Page(object_list, 1, self)
+        page.next_cursor = None
+        page.previous_cursor = None
+        if object_list:
+            if has_more or direction == PREVIOUS:
+                page.next_cursor = encode_cursor(NEXT, object_list[-1])
+            if (has_more and direction == PREVIOUS) or direction == NEXT:
+                page.previous_cursor = encode_cursor(
+                    PREVIOUS, object_list[0]
+                )
+        return page
+
+
+class ChronologicalPaginator(Paginator):
+    """Вывод от старых записей к новым по ключу (created, id).
+
+    Страницы загружаются только вперёд, как подгрузка комментариев:
+    курсор указывает на последнюю показанную запись.
+    """
+    is_cursor = True
+    date_field = 'created'
+
+    def _check_object_list_is_ordered(self):
+        # Порядок задаёт сам пагинатор в get_cursor_page.
+        pass
+
+    def get_cursor_page(self, cursor):
+        queryset = self.object_list.order_by(self.date_field, 'pk')
+        position = decode_cursor(cursor)
+        if position is not None and position[0] == NEXT:
+            _, created, pk = position
+            queryset = queryset.filter(
+                Q(**{f'{self.date_field}__gt': created})
+                | Q(**{self.date_field: created, 'pk__gt': pk}),
+                **{f'{self.date_field}__gte': created}
+            )
+        rows = list(queryset[:self.per_page + 1])
+        page = Page(rows[:self.per_page], 1, self)
+        page.previous_cursor = None
+        page.next_cursor = None
+        if len(rows) > self.per_page:
+            page.next_cursor = encode_cursor(
+                NEXT, page.object_list[-1], self.date_field
+            )
+        return page
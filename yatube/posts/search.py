@@ -0,0 +1,258 @@
+"""Полнотекстовый поиск по текстам постов и названиям групп.
+
+На SQLite используется виртуальная таблица FTS5, на других базах и там,
+где SQLite собран без FTS5, — инвертированный индекс в памяти процесса.
+Оба индекса обновляются сигналами при сохранении и удалении постов и
+возвращают пары (score, post_id): чем меньше score, тем выше пост в
+выдаче. По этим парам строится постраничный вывод по ключу.
+
+Индекс в памяти у каждого процесса свой. Процесс, сохранивший пост,
+обновляет свой индекс на месте и меняет общее поколение SEARCH_SCOPE
+(см. feed_cache); остальные процессы перестраивают индекс при первом
+поиске после этого.
+"""
+import base64
+import binascii
+import math
+import re
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db import connection
+
+from . import feed_cache
+from .models import Post
+
+TABLE = 'posts_search'
+SEARCH_SCOPE = 'search'
+WORD = re.compile(r'\w+')
+
+
+def tokenize(text):
+    return WORD.findall(text.lower())
+
+
+def encode_cursor(score, post_id):
+    raw = f'{score!r}|{post_id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        score, post_id = base64.urlsafe_b64decode(
+            padded.encode()
+        ).decode().split('|')
+        return float(score), int(post_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+class SQLiteFTSIndex:
+    def index(self, post_id, text, group_title):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {TABLE} WHERE rowid = %s', [post_id])
+            cursor.execute(
+                f'INSERT INTO {TABLE} (rowid, text, group_title) '
+                f'VALUES (%s, %s, %s)',
+                [post_id, text, group_title]
+            )
+
+    def remove(self, post_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {TABLE} WHERE rowid = %s', [post_id])
+
+    def rename_group(self, group_id, title):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {TABLE} SET group_title = %s WHERE rowid IN '
+                f'(SELECT id FROM posts_post WHERE group_id = %s)',
+                [title, group_id]
+            )
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {TABLE}')
+            cursor.execute(
+                f'INSERT INTO {TABLE} (rowid, text, group_title) '
+                f'SELECT p.id, p.text, COALESCE(g.title, \'\') '
+                f'FROM posts_post p LEFT JOIN posts_group g '
+                f'ON g.id = p.group_id'
+            )
+
+    def search(self, query, limit=None, after=None):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        # Каждое слово берётся в кавычки, чтобы ввод пользователя
+        # не разбирался как синтаксис FTS5; последнее ищется по префиксу.
+        match = ' '.join(f'"{term}"' for term in terms) + '*'
+        sql = (
+            f'SELECT score, id FROM ('
+            f'SELECT bm25({TABLE}, 1.0, 0.5) AS score, rowid AS id '
+            f'FROM {TABLE} WHERE {TABLE} MATCH %s)'
+        )
+        params = [match]
+        if after is not None:
+            sql += ' WHERE score > %s OR (score = %s AND id > %s)'
+            params += [after[0], after[0], after[1]]
+        sql += ' ORDER BY score, id'
+        if limit is not None:
+            sql += ' LIMIT %s'
+            params.append(limit)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+
+class MemoryIndex:
+    """Инвертированный индекс в памяти с ранжированием по TF-IDF."""
+
+    def __init__(self):
+        self._postings = defaultdict(dict)
+        self._documents = {}
+        self._lock = threading.RLock()
+        self._generation = None
+
+    def _load(self):
+        generation, = feed_cache.get_generations([SEARCH_SCOPE])
+        with self._lock:
+            if self._generation == generation:
+                return
+            self._postings.clear()
+            self._documents.clear()
+            posts = Post.objects.order_by().values_list(
+                'pk', 'text', 'group__title'
+            )
+            for post_id, text, group_title in posts.iterator():
+                self._add(post_id, text, group_title or '')
+            self._generation = generation
+
+    def _add(self, post_id, text, group_title):
+        terms = tokenize(text) + tokenize(group_title)
+        counts = defaultdict(int)
+        for term in terms:
+            counts[term] += 1
+        for term, count in counts.items():
+            self._postings[term][post_id] = count
+        self._documents[post_id] = (tuple(counts), len(terms) or 1)
+
+    def _discard(self, post_id):
+        terms, _ = self._documents.pop(post_id, ((), 0))
+        for term in terms:
+            self._postings[term].pop(post_id, None)
+            if not self._postings[term]:
+                del self._postings[term]
+
+    @contextmanager
+    def _changing(self):
+        before, = feed_cache.get_generations([SEARCH_SCOPE])
+        with self._lock:
+            yield
+            generation = feed_cache.bump(SEARCH_SCOPE)[SEARCH_SCOPE]
+            # Индекс, отстававший до изменения, всё равно перечитает
+            # посты при следующем поиске.
+            if self._generation == before:
+                self._generation = generation
+
+    def index(self, post_id, text, group_title):
+        with self._changing():
+            self._discard(post_id)
+            self._add(post_id, text, group_title)
+
+    def remove(self, post_id):
+        with self._changing():
+            self._discard(post_id)
+
+    def rename_group(self, group_id, title):
+        posts = Post.objects.filter(group_id=group_id).values_list(
+            'pk', 'text'
+        )
+        with self._changing():
+            for post_id, text in posts:
+                self._discard(post_id)
+                self._add(post_id, text, title)
+
+    def rebuild(self):
+        # Индексы всех процессов, включая этот, перечитают посты при
+        # следующем поиске.
+        feed_cache.bump(SEARCH_SCOPE)
+
+    def _matches(self, term, prefix):
+        if not prefix:
+            return self._postings.get(term, {})
+        merged = {}
+        for candidate, postings in self._postings.items():
+            if candidate.startswith(term):
+                for post_id, count in postings.items():
+                    merged[post_id] = merged.get(post_id, 0) + count
+        return merged
+
+    def search(self, query, limit=None, after=None):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        self._load()
+        with self._lock:
+            total = len(self._documents)
+            scores = None
+            for position, term in enumerate(terms):
+                postings = self._matches(term, position == len(terms) - 1)
+                idf = math.log(1 + total / (1 + len(postings)))
+                found = {
+                    post_id: count / self._documents[post_id][1] * idf
+                    for post_id, count in postings.items()
+                }
+                if scores is None:
+                    scores = found
+                else:
+                    scores = {
+                        post_id: score + found[post_id]
+                        for post_id, score in scores.items()
+                        if post_id in found
+                    }
+        results = sorted(
+            (-score, post_id) for post_id, score in scores.items()
+        )
+        if after is not None:
+            results = [result for result in results if result > tuple(after)]
+        return results[:limit] if limit is not None else results
+
+
+_memory_index = MemoryIndex()
+_fts_available = {}
+
+
+def get_index():
+    if connection.vendor == 'sqlite':
+        name = connection.settings_dict['NAME']
+        if name not in _fts_available:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT 1 FROM sqlite_master WHERE name = %s', [TABLE]
+                )
+                _fts_available[name] = cursor.fetchone() is not None
+        if _fts_available[name]:
+            return SQLiteFTSIndex()
+    return _memory_index
+
+
+def index_post(post):
+    group_title = post.group.title if post.group_id else ''
+    get_index().index(post.pk, post.text, group_title)
+
+
+def search(query, limit=None, cursor=None):
+    """Возвращает id постов страницы и курсор следующей страницы."""
+    after = decode_cursor(cursor)
+    rows = get_index().search(
+        query, None if limit is None else limit + 1, after
+    )
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(*rows[-1])
+    return [post_id for _, post_id in rows], next_cursor
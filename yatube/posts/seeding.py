@@ -0,0 +1,272 @@
+"""Быстрое заполнение базы тестовыми данными.
+
+Строки создаются bulk_create пачками внутри транзакций, с заранее
+назначенными id, поэтому посты, комментарии и подписки ссылаются друг на
+друга без повторных запросов. Сигналы моделей при этом не срабатывают:
+ленты подписок, счётчики и поисковый индекс заполняются отдельно.
+Одинаковое зерно даёт одинаковые данные.
+"""
+import os
+import random
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from PIL import Image, ImageDraw
+
+from . import feed_cache
+from .groups import DIRECTORY_SCOPE
+from .models import Comment, Follow, Group, Post, User, UserStats
+from .search import get_index
+
+WORDS = (
+    'лето город река дорога книга музыка утро вечер поезд море кофе '
+    'работа друзья кино фото горы снег дождь парк история'
+).split()
+IMAGE_DIRECTORY = 'posts'
+
+
+def zipf(size):
+    """Накопленные веса рангов 1..size по закону Ципфа."""
+    weights, total = [], 0
+    for rank in range(1, size + 1):
+        total += 1 / rank
+        weights.append(total)
+    return weights
+
+
+@contextmanager
+def explicit_dates():
+    # auto_now_add перезаписал бы даты, разнесённые по времени.
+    fields = [
+        Post._meta.get_field('pub_date'),
+        Comment._meta.get_field('created'),
+    ]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def render_image(args):
+    """Рисует картинку поста, выполняется в отдельном процессе."""
+    root, name, seed = args
+    rng = random.Random(seed)
+    image = Image.new('RGB', (960, 640), tuple(rng.choices(range(256), k=3)))
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x, y = rng.randrange(960), rng.randrange(640)
+        size = rng.randrange(40, 320)
+        draw.ellipse(
+            (x, y, x + size, y + size),
+            fill=tuple(rng.choices(range(256), k=3))
+        )
+    path = os.path.join(root, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    image.save(path, 'JPEG', quality=80)
+    return name
+
+
+class Seeder:
+    def __init__(self, users=1000, groups=20, posts=10000, comments=10000,
+                 follows=20, images=0.0, seed=0, batch_size=5000,
+                 workers=1, prefix='seed'):
+        self.sizes = {
+            'users': users,
+            'groups': groups,
+            'posts': posts,
+            'comments': comments,
+        }
+        self.follows = follows
+        self.images = images
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.batch_size = batch_size
+        self.workers = workers
+        self.prefix = prefix
+        self.report = []
+
+    def insert(self, model, rows):
+        """bulk_create пачками, не собирая весь генератор в память."""
+        rows = iter(rows)
+        total = 0
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                return total
+            model.objects.bulk_create(batch)
+            total += len(batch)
+
+    @contextmanager
+    def step(self, name):
+        started = time.perf_counter()
+        result = {}
+        with transaction.atomic():
+            yield result
+        self.report.append(
+            (name, result.get('rows', 0), time.perf_counter() - started)
+        )
+
+    def first_id(self, model):
+        return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+    def text(self, words):
+        return ' '.join(self.rng.choices(WORDS, k=words))
+
+    def run(self):
+        users = self.seed_users()
+        groups = self.seed_groups()
+        graph = self.seed_follows(users)
+        posts = self.seed_posts(users, groups)
+        self.seed_comments(users, posts)
+        self.seed_timelines(posts)
+        self.seed_stats(users, graph)
+        with self.step('search') as result:
+            get_index().rebuild()
+            result['rows'] = Post.objects.count()
+        feed_cache.bump(feed_cache.GLOBAL, DIRECTORY_SCOPE)
+        return self.report
+
+    def seed_users(self):
+        first = self.first_id(User)
+        ids = range(first, first + self.sizes['users'])
+        password = make_password(None)
+        with self.step('users') as result:
+            result['rows'] = self.insert(User, (
+                User(pk=pk, username=f'{self.prefix}{pk}', password=password,
+                     first_name='Имя', last_name=f'Фамилия{pk}')
+                for pk in ids
+            ))
+        return ids
+
+    def seed_groups(self):
+        first = self.first_id(Group)
+        ids = range(first, first + self.sizes['groups'])
+        with self.step('groups') as result:
+            result['rows'] = self.insert(Group, (
+                Group(pk=pk, title=f'Группа {pk}',
+                      slug=f'{self.prefix}-group-{pk}',
+                      description=self.text(20))
+                for pk in ids
+            ))
+        return ids
+
+    def seed_follows(self, users):
+        # Популярность авторов распределена по закону Ципфа: несколько
+        # авторов набирают подписчиков больше FEED_FANOUT_MAX_FOLLOWERS.
+        weights = zipf(len(users))
+        graph = {}
+        for user_id in users:
+            authors = set(self.rng.choices(
+                users, cum_weights=weights, k=self.follows
+            ))
+            authors.discard(user_id)
+            graph[user_id] = authors
+        with self.step('follows') as result:
+            result['rows'] = self.insert(Follow, (
+                Follow(user_id=user_id, author_id=author_id)
+                for user_id, authors in graph.items()
+                for author_id in authors
+            ))
+        return graph
+
+    def seed_posts(self, users, groups):
+        first = self.first_id(Post)
+        size = self.sizes['posts']
+        ids = range(first, first + size)
+        authors = self.rng.choices(users, cum_weights=zipf(len(users)),
+                                   k=size)
+        group_weights = zipf(len(groups))
+        # Примерно половина постов публикуется без группы.
+        post_groups = self.rng.choices(
+            [None, *groups],
+            cum_weights=[group_weights[-1], *(
+                group_weights[-1] + weight for weight in group_weights
+            )] if groups else [1],
+            k=size
+        )
+        # Комментарии тоже тяготеют к немногим популярным постам, их
+        # адресаты выбираются заранее, чтобы сразу записать comment_count.
+        self.comment_targets = self.rng.choices(
+            ids, cum_weights=zipf(size), k=self.sizes['comments']
+        )
+        comment_counts = Counter(self.comment_targets)
+        images = self.seed_images(ids)
+        now = timezone.now()
+        self.post_authors = dict(zip(ids, authors))
+        with self.step('posts') as result, explicit_dates():
+            result['rows'] = self.insert(Post, (
+                Post(pk=pk, text=self.text(30), author_id=author_id,
+                     group_id=group_id, image=images.get(pk, ''),
+                     comment_count=comment_counts[pk],
+                     pub_date=now - timedelta(minutes=size - number))
+                for number, (pk, author_id, group_id) in enumerate(
+                    zip(ids, authors, post_groups)
+                )
+            ))
+        return ids
+
+    def seed_images(self, ids):
+        if not self.images:
+            return {}
+        chosen = [pk for pk in ids if self.rng.random() < self.images]
+        jobs = [
+            (settings.MEDIA_ROOT,
+             f'{IMAGE_DIRECTORY}/{self.prefix}_{pk}.jpg',
+             f'{self.seed}:{pk}')
+            for pk in chosen
+        ]
+        with self.step('images') as result:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                names = list(pool.map(render_image, jobs, chunksize=16))
+            result['rows'] = len(names)
+        return dict(zip(chosen, names))
+
+    def seed_comments(self, users, posts):
+        now = timezone.now()
+        with self.step('comments') as result, explicit_dates():
+            result['rows'] = self.insert(Comment, (
+                Comment(post_id=post_id, author_id=self.rng.choice(users),
+                        text=self.text(10),
+                        created=now - timedelta(minutes=posts[-1] - post_id))
+                for post_id in self.comment_targets
+            ))
+
+    def seed_timelines(self, posts):
+        # Ленты подписок раскладываются одним INSERT ... SELECT: строк
+        # в них на порядок больше, чем постов.
+        with self.step('timelines') as result, connection.cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO posts_timelineentry (user_id, post_id) '
+                'SELECT f.user_id, p.id FROM posts_post p '
+                'JOIN posts_follow f ON f.author_id = p.author_id '
+                'WHERE p.id >= %s AND p.author_id IN ('
+                'SELECT author_id FROM posts_follow '
+                'GROUP BY author_id HAVING COUNT(*) <= %s)',
+                [posts[0], settings.FEED_FANOUT_MAX_FOLLOWERS]
+            )
+            result['rows'] = cursor.rowcount
+
+    def seed_stats(self, users, graph):
+        post_counts = Counter(self.post_authors.values())
+        followers = Counter(
+            author_id for authors in graph.values() for author_id in authors
+        )
+        with self.step('stats') as result:
+            result['rows'] = self.insert(UserStats, (
+                UserStats(user_id=pk, post_count=post_counts[pk],
+                          follower_count=followers[pk],
+                          following_count=len(graph[pk]))
+                for pk in users
+            ))
@@ -0,0 +1,230 @@
+import logging
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models.signals import (post_delete, post_init, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+
+from . import counters, feed_cache, groups, search, timeline
+from .models import Comment, Follow, Group, Post, User, UserStats
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=User)
+def create_user_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+def count_new_post(sender, instance, created, **kwargs):
+    if created:
+        counters.change_user_stats(instance.author_id, post_count=1)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    counters.change_user_stats(instance.author_id, post_count=-1)
+
+
+@receiver(post_save, sender=Comment)
+def count_new_comment(sender, instance, created, **kwargs):
+    if created:
+        counters.change_comment_count(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    counters.change_comment_count(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def count_new_follow(sender, instance, created, **kwargs):
+    if created:
+        counters.change_user_stats(instance.author_id, follower_count=1)
+        counters.change_user_stats(instance.user_id, following_count=1)
+
+
+@receiver(post_delete, sender=Follow)
+def count_deleted_follow(sender, instance, **kwargs):
+    counters.change_user_stats(instance.author_id, follower_count=-1)
+    counters.change_user_stats(instance.user_id, following_count=-1)
+
+
+@receiver(post_save, sender=Post)
+def fan_out_new_post(sender, instance, created, **kwargs):
+    if created:
+        timeline.fan_out_post(instance)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, **kwargs):
+    if created:
+        timeline.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def prune_timeline(sender, instance, **kwargs):
+    timeline.prune(instance.user_id, instance.author_id)
+    timeline.lost_follower(instance.author_id)
+
+
+def _bump_post_feeds(post_id, author_id, group_ids):
+    scopes = [feed_cache.GLOBAL, feed_cache.post_scope(post_id)]
+    scopes += [
+        feed_cache.author_scope(username) for username in
+        User.objects.filter(pk=author_id).values_list('username', flat=True)
+    ]
+    scopes += [
+        feed_cache.group_scope(slug) for slug in
+        Group.objects.filter(
+            pk__in=[pk for pk in group_ids if pk is not None]
+        ).values_list('slug', flat=True)
+    ]
+    feed_cache.bump(*scopes)
+
+
+@receiver(post_init, sender=Post)
+def remember_post_group(sender, instance, **kwargs):
+    # Как и в _image_name: отложенное поле не загружается запросом.
+    instance._initial_group_id = instance.__dict__.get('group_id')
+
+
+@receiver(post_save, sender=Post)
+def invalidate_saved_post(sender, instance, **kwargs):
+    _bump_post_feeds(
+        instance.pk,
+        instance.author_id,
+        {instance._initial_group_id, instance.group_id}
+    )
+    instance._initial_group_id = instance.group_id
+
+
+@receiver(post_delete, sender=Post)
+def invalidate_deleted_post(sender, instance, **kwargs):
+    _bump_post_feeds(instance.pk, instance.author_id, {instance.group_id})
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_commented_post(sender, instance, **kwargs):
+    post = Post.objects.filter(pk=instance.post_id).values(
+        'author_id', 'group_id'
+    ).first()
+    if post is not None:
+        _bump_post_feeds(
+            instance.post_id, post['author_id'], {post['group_id']}
+        )
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow_feeds(sender, instance, **kwargs):
+    scopes = [feed_cache.follow_scope(instance.user_id)]
+    scopes += [
+        feed_cache.author_scope(username) for username in
+        User.objects.filter(
+            pk=instance.author_id
+        ).values_list('username', flat=True)
+    ]
+    feed_cache.bump(*scopes)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group_feeds(sender, instance, **kwargs):
+    feed_cache.bump(
+        feed_cache.GLOBAL,
+        feed_cache.group_scope(instance.slug),
+        feed_cache.group_id_scope(instance.pk),
+        groups.DIRECTORY_SCOPE
+    )
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_feeds(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    feed_cache.bump(
+        feed_cache.GLOBAL,
+        feed_cache.author_scope(instance.username),
+        feed_cache.user_scope(instance.pk)
+    )
+
+
+def _image_name(instance):
+    # Поле могло быть отложено (only/defer): тогда его не читаем, иначе
+    # каждый такой пост стоил бы отдельного запроса.
+    image = instance.__dict__.get('image')
+    return getattr(image, 'name', image) or None
+
+
+def _delete_image(name):
+    try:
+        default_storage.delete(name)
+    except (OSError, SuspiciousFileOperation):
+        # Например, путь вне MEDIA_ROOT, записанный в обход формы.
+        logger.exception('Не удалось удалить картинку %s', name)
+
+
+def _release_image(name):
+    transaction.on_commit(lambda: _delete_image(name))
+
+
+@receiver(post_init, sender=Post)
+def remember_post_image(sender, instance, **kwargs):
+    instance._initial_image = _image_name(instance)
+
+
+@receiver(pre_save, sender=Post)
+def remember_image_upload(sender, instance, **kwargs):
+    image = instance.__dict__.get('image')
+    if image:
+        # Дескриптор оборачивает новый файл в FieldFile с _committed=False.
+        image = instance.image
+    instance._image_uploaded = bool(image) and not image._committed
+
+
+@receiver(post_save, sender=Post)
+def release_replaced_image(sender, instance, **kwargs):
+    image = _image_name(instance)
+    if instance._initial_image and instance._initial_image != image:
+        _release_image(instance._initial_image)
+    elif image and image == instance._initial_image and (
+        instance._image_uploaded
+    ):
+        # Заново загружен тот же файл: хранилище добавило ему ссылку,
+        # хотя пост по-прежнему ссылается на него один раз.
+        _release_image(image)
+    instance._initial_image = image
+
+
+@receiver(post_delete, sender=Post)
+def release_deleted_image(sender, instance, **kwargs):
+    image = _image_name(instance)
+    if image:
+        _release_image(image)
+
+
+@receiver(post_save, sender=Post)
+def index_saved_post(sender, instance, **kwargs):
+    search.index_post(instance)
+
+
+@receiver(post_delete, sender=Post)
+def unindex_deleted_post(sender, instance, **kwargs):
+    search.get_index().remove(instance.pk)
+
+
+@receiver(post_save, sender=Group)
+def reindex_group_posts(sender, instance, created, **kwargs):
+    if not created:
+        search.get_index().rename_group(instance.pk, instance.title)
+
+
+@receiver(pre_delete, sender=Group)
+def unindex_group_title(sender, instance, **kwargs):
+    search.get_index().rename_group(instance.pk, '')
@@ -0,0 +1,20 @@
+import logging
+
+from django import template
+
+from posts import thumbnails
+
+register = template.Library()
+logger = logging.getLogger(__name__)
+
+
+@register.simple_tag
+def post_thumbnail(image, alias='card'):
+    if not image:
+        return None
+    try:
+        return thumbnails.thumbnail_url(image.name, alias)
+    except Exception:
+        # Как и тег sorl-thumbnail, сломанная картинка не роняет страницу.
+        logger.exception('Не удалось получить миниатюру %s', image.name)
+        return None
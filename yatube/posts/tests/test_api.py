@@ -0,0 +1,153 @@
+from http import HTTPStatus
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from yatube.settings import posts_per_page
+
+from ..models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+class PostsAPITests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Author')
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        for i in range(posts_per_page + 2):
+            cls.post = Post.objects.create(
+                text=f'Тестовая запись {i}',
+                author=cls.author,
+                group=cls.group,
+            )
+        Comment.objects.create(
+            post=cls.post, author=cls.reader, text='Комментарий'
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        self.reader_client = Client()
+        self.reader_client.force_login(PostsAPITests.reader)
+        cache.clear()
+
+    def test_feeds(self):
+        """Ленты отдают страницу записей и курсор следующей страницы."""
+        urls = [
+            reverse('posts:api_index'),
+            reverse(
+                'posts:api_group_list',
+                kwargs={'slug': PostsAPITests.group.slug}
+            ),
+            reverse(
+                'posts:api_profile',
+                kwargs={'username': PostsAPITests.author.username}
+            ),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                data = self.client.get(url).json()
+                self.assertEqual(len(data['results']), posts_per_page)
+                self.assertEqual(
+                    data['results'][0]['id'], PostsAPITests.post.id
+                )
+                self.assertIsNotNone(data['next'])
+                data = self.client.get(url, {'cursor': data['next']}).json()
+                self.assertEqual(len(data['results']), 2)
+
+    def test_post_detail(self):
+        """Пост отдаётся вместе с комментариями."""
+        data = self.client.get(
+            reverse(
+                'posts:api_post_detail',
+                kwargs={'post_id': PostsAPITests.post.id}
+            )
+        ).json()
+        self.assertEqual(data['comment_count'], 1)
+        self.assertEqual(data['comments'][0]['author'], 'Reader')
+        self.assertIsNone(data['comments_next'])
+
+    @override_settings(COMMENTS_PER_PAGE=1)
+    def test_post_comments(self):
+        """Следующие страницы комментариев отдаются по курсору."""
+        post = PostsAPITests.post
+        Comment.objects.create(post=post, author=post.author, text='Второй')
+        data = self.client.get(
+            reverse('posts:api_post_detail', kwargs={'post_id': post.id})
+        ).json()
+        self.assertEqual(len(data['comments']), 1)
+        url = reverse('posts:api_post_comments', kwargs={'post_id': post.id})
+        data = self.client.get(url, {'cursor': data['comments_next']}).json()
+        self.assertEqual(
+            [comment['text'] for comment in data['results']], ['Второй']
+        )
+        self.assertIsNone(data['next'])
+
+    def test_follow_feed(self):
+        """Лента подписок доступна только авторизованному пользователю."""
+        url = reverse('posts:api_follow_index')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED)
+        data = self.reader_client.get(url).json()
+        self.assertEqual(len(data['results']), posts_per_page)
+
+    def test_not_modified(self):
+        """Повторный запрос с ETag получает 304, пока лента не изменится."""
+        url = reverse('posts:api_index')
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        Post.objects.create(text='Новая запись', author=self.reader)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_comment_changes_post_etag(self):
+        """Новый комментарий меняет ETag поста."""
+        url = reverse(
+            'posts:api_post_detail',
+            kwargs={'post_id': PostsAPITests.post.id}
+        )
+        etag = self.client.get(url)['ETag']
+        Comment.objects.create(
+            post=PostsAPITests.post, author=self.reader, text='Ещё один'
+        )
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_author_and_group_change_post_etag(self):
+        """Изменение автора или группы поста меняет его ETag,
+        а удалённый пост не получает 304.
+        """
+        post = Post.objects.create(
+            text='Пост', author=self.author, group=self.group
+        )
+        for url in (
+            reverse('posts:api_post_detail', kwargs={'post_id': post.id}),
+            reverse('posts:api_post_comments', kwargs={'post_id': post.id}),
+        ):
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                self.author.first_name = f'Имя {url}'
+                self.author.save()
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+                etag = response['ETag']
+                self.group.title = f'Группа {url}'
+                self.group.save()
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+        etag = response['ETag']
+        post.delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
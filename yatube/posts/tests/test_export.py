@@ -0,0 +1,224 @@
+import csv
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from core.models import StoredFile
+
+from .. import counters, search, timeline
+from ..importer import PostImporter
+from ..models import Comment, Follow, Group, Post
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+User = get_user_model()
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Author')
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            text='Пост в группе', author=cls.author, group=cls.group
+        )
+        cls.other_post = Post.objects.create(
+            text='Пост читателя', author=cls.reader
+        )
+        Comment.objects.create(
+            post=cls.post, author=cls.reader, text='Комментарий'
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def export(self, *args, **options):
+        out = StringIO()
+        call_command('export_data', *args, stdout=out, **options)
+        return out.getvalue()
+
+    def test_jsonl_filters(self):
+        """Выгрузка JSON Lines учитывает фильтры по группе и автору."""
+        lines = self.export('posts', format='jsonl', group='test-slug')
+        rows = [json.loads(line) for line in lines.splitlines()]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['id'], ExportTests.post.id)
+        self.assertEqual(rows[0]['author'], 'Author')
+        self.assertEqual(rows[0]['group'], 'test-slug')
+        lines = self.export('comments', format='jsonl', group='test-slug')
+        self.assertEqual(json.loads(lines)['author'], 'Reader')
+        lines = self.export('follows', format='jsonl', author='Author')
+        self.assertEqual(json.loads(lines)['user'], 'Reader')
+
+    def test_csv_date_range(self):
+        """CSV начинается с заголовка, даты ограничивают выгрузку."""
+        rows = list(csv.reader(StringIO(self.export('posts'))))
+        self.assertEqual(rows[0][:3], ['id', 'text', 'pub_date'])
+        self.assertEqual(len(rows), 3)
+        tomorrow = (timezone.now() + timedelta(days=1)).isoformat()
+        rows = list(csv.reader(StringIO(
+            self.export('posts', '--since', tomorrow)
+        )))
+        self.assertEqual(len(rows), 1)
+
+    def test_admin_action(self):
+        """Действие админки отдаёт выбранные посты потоком."""
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass'
+        )
+        client = Client()
+        client.force_login(admin)
+        response = client.post(
+            reverse('admin:posts_post_changelist'),
+            {
+                'action': 'export_jsonl',
+                '_selected_action': [ExportTests.other_post.id],
+            }
+        )
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment', response['Content-Disposition'])
+        content = b''.join(response.streaming_content).decode()
+        self.assertEqual(
+            json.loads(content)['id'], ExportTests.other_post.id
+        )
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ImportTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Author')
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.group = Group.objects.create(
+            title='Путешествия',
+            slug='travel',
+            description='Тестовое описание',
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def write_lines(self, rows):
+        handle, path = tempfile.mkstemp(suffix='.jsonl')
+        with os.fdopen(handle, 'w', encoding='utf-8') as lines:
+            for row in rows:
+                lines.write(json.dumps(row, ensure_ascii=False) + '\n')
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_import_posts(self):
+        """Импорт пропускает ошибочные строки и заполняет производные
+        данные: счётчики, ленты подписок и поисковый индекс.
+        """
+        image = os.path.join(TEMP_MEDIA_ROOT, 'source.gif')
+        os.makedirs(TEMP_MEDIA_ROOT, exist_ok=True)
+        with open(image, 'wb') as gif:
+            gif.write(SMALL_GIF)
+        path = self.write_lines([
+            {'text': 'Поездка на море', 'author': 'Author',
+             'group': 'travel', 'pub_date': '2020-01-01T10:00:00',
+             'image': image},
+            {'text': '', 'author': 'Author'},
+            {'text': 'Чужой пост', 'author': 'Nobody'},
+            {'text': 'Новый автор', 'author': 'Nobody', 'group': 'missing'},
+        ])
+        err = StringIO()
+        call_command(
+            'import_posts', path, stdout=StringIO(), stderr=err
+        )
+        post = Post.objects.get()
+        self.assertEqual(post.group, ImportTests.group)
+        self.assertEqual(post.pub_date.year, 2020)
+        self.assertTrue(post.image.name.startswith('posts/'))
+        # Картинка перекодирована, как загруженная через форму.
+        self.assertTrue(post.image.name.endswith('.jpg'))
+        self.assertEqual(
+            StoredFile.objects.get(name=post.image.name).references, 1
+        )
+        self.assertEqual(len(err.getvalue().splitlines()), 3)
+        self.assertEqual(counters.recount(), (0, 0))
+        self.assertTrue(
+            timeline.follow_feed(ImportTests.reader).filter(
+                pk=post.pk
+            ).exists()
+        )
+        self.assertEqual(search.search('море')[0], [post.pk])
+
+    def test_resume_from_checkpoint(self):
+        """После сбоя импорт продолжается с контрольной точки."""
+        path = self.write_lines([
+            {'text': f'Пост {i}', 'author': 'Author'} for i in range(3)
+        ])
+        checkpoint = f'{path}.checkpoint'
+        self.addCleanup(
+            lambda: os.path.exists(checkpoint) and os.remove(checkpoint)
+        )
+        importer = PostImporter(batch_size=2, checkpoint=checkpoint)
+        original = importer.insert
+        calls = []
+
+        def failing_insert(posts):
+            calls.append(posts)
+            if len(calls) == 2:
+                raise RuntimeError('сбой')
+            original(posts)
+
+        importer.insert = failing_insert
+        with open(path) as lines, self.assertRaises(RuntimeError):
+            importer.run(lines)
+        self.assertEqual(Post.objects.count(), 2)
+        call_command('import_posts', path, stdout=StringIO())
+        self.assertEqual(
+            sorted(Post.objects.values_list('text', flat=True)),
+            ['Пост 0', 'Пост 1', 'Пост 2']
+        )
+        self.assertFalse(os.path.exists(checkpoint))
+
+    def test_failed_batch_leaves_no_images(self):
+        """Картинки откатившейся пачки удаляются из хранилища."""
+        image = os.path.join(TEMP_MEDIA_ROOT, 'rollback.gif')
+        os.makedirs(TEMP_MEDIA_ROOT, exist_ok=True)
+        with open(image, 'wb') as gif:
+            gif.write(SMALL_GIF + b'rollback')
+        path = self.write_lines([
+            {'text': 'Пост', 'author': 'Author', 'image': image},
+        ])
+        importer = PostImporter()
+
+        def failing_insert(posts):
+            raise RuntimeError('сбой')
+
+        importer.insert = failing_insert
+        with open(path) as lines, self.assertRaises(RuntimeError):
+            importer.run(lines)
+        self.assertFalse(StoredFile.objects.exists())
+        stored = [
+            name for _, _, names in os.walk(
+                os.path.join(TEMP_MEDIA_ROOT, 'posts')
+            ) for name in names
+        ]
+        self.assertEqual(stored, [])
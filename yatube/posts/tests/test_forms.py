@@ -1,11 +1,20 @@
 import shutil
 import tempfile
+from io import BytesIO
+from unittest import mock
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import OperationalError
+from django.db.models import F
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
+from core.models import StoredFile
+from posts import commenting, signals, thumbnails
 from posts.forms import PostForm
 from posts.models import Comment, Post
 
@@ -63,15 +72,73 @@ class PostsCreateFormTests(TestCase):
             follow=True
         )
         self.assertEqual(Post.objects.count(), posts_count + 1)
-        self.assertTrue(
-            Post.objects.filter(
-                text=form_data['text'],
-                author=PostsCreateFormTests.user,
-                image=f'posts/{uploaded.name}',
-                group=None
-            ).exists()
+        post = Post.objects.get(
+            text=form_data['text'],
+            author=PostsCreateFormTests.user,
+            group=None
+        )
+        # Картинка перекодирована и сохранена по хешу содержимого.
+        self.assertRegex(
+            post.image.name,
+            r'^posts/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$'
         )
 
+    @override_settings(IMAGE_MAX_SIZE=100)
+    def test_uploaded_image_processed(self):
+        """Большая картинка уменьшается, а EXIF из неё удаляется."""
+        source = BytesIO()
+        exif = Image.Exif()
+        exif[0x010F] = 'Камера'
+        Image.new('RGB', (400, 200), (200, 30, 30)).save(
+            source, 'PNG', exif=exif
+        )
+        uploaded = SimpleUploadedFile(
+            name='large.png', content=source.getvalue(),
+            content_type='image/png'
+        )
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Большая картинка', 'image': uploaded},
+        )
+        post = Post.objects.get(text='Большая картинка')
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.format, 'JPEG')
+            self.assertEqual(image.size, (100, 50))
+            self.assertFalse(image.getexif())
+
+    def test_create_post_thumbnails(self):
+        """Пока миниатюра создаётся, на странице поста выводится заглушка,
+        после создания - готовая миниатюра.
+        """
+        cache.clear()
+        uploaded = SimpleUploadedFile(
+            name='thumb.gif',
+            content=PostsCreateFormTests.small_gif,
+            content_type='image/gif'
+        )
+        with override_settings(THUMBNAIL_ASYNC=True):
+            self.authorized_client.post(
+                reverse('posts:post_create'),
+                data={'text': 'Пост с картинкой', 'image': uploaded},
+            )
+            post = Post.objects.get(text='Пост с картинкой')
+            url = reverse('posts:post_detail', kwargs={'post_id': post.id})
+            response = self.authorized_client.get(url)
+            self.assertContains(response, 'bg-light')
+            # Главная с заглушкой попадает в кеш лент.
+            self.assertContains(
+                self.authorized_client.get(reverse('posts:index')),
+                'bg-light'
+            )
+        # Соединение теста закрывать нельзя.
+        with mock.patch.object(thumbnails, 'connection'):
+            thumbnails._generate_in_background(post.image.name)
+        thumbnail_url = thumbnails.thumbnail_url(post.image.name, 'card')
+        response = self.authorized_client.get(url)
+        self.assertContains(response, thumbnail_url)
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertContains(response, thumbnail_url)
+
     def test_edit_post(self):
         """При отправке валидной формы со страницы редактирования поста
         происходит изменение поста с post_id в базе данных.
@@ -91,6 +158,54 @@ class PostsCreateFormTests(TestCase):
         )
         self.assertEqual(Post.objects.all().first().text, form_data['text'])
 
+    def test_same_image_uploaded_again(self):
+        """Повторная загрузка той же картинки при редактировании
+        не добавляет ссылку на файл.
+        """
+        post = Post.objects.create(text='С картинкой', author=self.user)
+        url = reverse('posts:post_edit', kwargs={'post_id': post.id})
+        # TestCase не выполняет on_commit, поэтому ссылка освобождается
+        # сразу.
+        with mock.patch.object(
+            signals, '_release_image', side_effect=signals._delete_image
+        ):
+            for _ in range(2):
+                self.authorized_client.post(url, {
+                    'text': 'С картинкой',
+                    'image': SimpleUploadedFile(
+                        'same.gif', PostsCreateFormTests.small_gif,
+                        content_type='image/gif'
+                    ),
+                })
+        post.refresh_from_db()
+        self.assertEqual(
+            StoredFile.objects.get(name=post.image.name).references, 1
+        )
+        self.assertTrue(default_storage.exists(post.image.name))
+
+    def test_edit_post_keeps_comment_count(self):
+        """Редактирование не затирает счётчик комментариев,
+        изменившийся после загрузки поста.
+        """
+        post = PostsCreateFormTests.post
+
+        def comment_meanwhile(form):
+            Post.objects.filter(pk=post.pk).update(
+                comment_count=F('comment_count') + 1
+            )
+            return form.cleaned_data
+
+        with mock.patch.object(
+            PostForm, 'clean', autospec=True, side_effect=comment_meanwhile
+        ):
+            self.authorized_client.post(
+                reverse('posts:post_edit', kwargs={'post_id': post.id}),
+                data={'text': 'Изменён во время комментария'},
+            )
+        post.refresh_from_db()
+        self.assertEqual(post.text, 'Изменён во время комментария')
+        self.assertEqual(post.comment_count, 1)
+
     def test_send_comment_authorized_client(self):
         """Авторизованный пользователь может комментировать посты.
         После успешной отправки комментарий появляется на странице поста.
@@ -134,3 +249,68 @@ class PostsCreateFormTests(TestCase):
             follow=True
         )
         self.assertEqual(Comment.objects.count(), comments_count)
+
+    @override_settings(COMMENT_RATE_BURST=1)
+    def test_comment_rate_limit(self):
+        """Пользователь не может отправлять комментарии чаще лимита."""
+        cache.clear()
+        comments_count = Comment.objects.count()
+        url = reverse(
+            'posts:add_comment',
+            kwargs={'post_id': PostsCreateFormTests.post.id}
+        )
+        self.authorized_client.post(url, {'text': 'Первый'})
+        response = self.authorized_client.post(url, {'text': 'Второй'})
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(Comment.objects.count(), comments_count + 1)
+
+    @override_settings(COMMENT_BUFFER_SECONDS=60)
+    def test_buffered_comments(self):
+        """В режиме очереди комментарии пишутся пачкой при сбросе."""
+        post = PostsCreateFormTests.post
+        comments_count = Comment.objects.count()
+        response = self.authorized_client.post(
+            reverse('posts:add_comment', kwargs={'post_id': post.id}),
+            {'text': 'Из очереди'}
+        )
+        self.assertRedirects(
+            response,
+            reverse('posts:post_detail', kwargs={'post_id': post.id})
+        )
+        self.assertEqual(Comment.objects.count(), comments_count)
+        self.assertEqual(commenting.flush(), 1)
+        self.assertEqual(
+            Post.objects.get(pk=post.pk).comment_count,
+            post.comment_count + 1
+        )
+        self.assertTrue(Comment.objects.filter(text='Из очереди').exists())
+
+    @override_settings(COMMENT_BUFFER_SECONDS=60)
+    def test_failed_flush_keeps_comments(self):
+        """Комментарии, которые не удалось записать, остаются в очереди,
+        а комментарии удалённых авторов отбрасываются.
+        """
+        post = PostsCreateFormTests.post
+        gone = User.objects.create_user(username='Gone')
+        commenting.submit(Comment(post=post, author=self.user, text='Ждёт'))
+        commenting.submit(Comment(post=post, author=gone, text='Ничей'))
+        gone.delete()
+        with mock.patch.object(
+            Comment.objects, 'bulk_create',
+            side_effect=OperationalError('database is locked')
+        ):
+            with self.assertRaises(OperationalError):
+                commenting.flush()
+        self.assertFalse(Comment.objects.filter(text='Ждёт').exists())
+        self.assertEqual(commenting.flush(), 1)
+        self.assertTrue(Comment.objects.filter(text='Ждёт').exists())
+        self.assertFalse(Comment.objects.filter(text='Ничей').exists())
+
+    def test_comment_to_missing_post(self):
+        """Комментарий к несуществующему посту даёт 404."""
+        response = self.authorized_client.post(
+            reverse('posts:add_comment', kwargs={'post_id': 0}),
+            {'text': 'Комментарий'}
+        )
+        self.assertEqual(response.status_code, 404)
@@ -1,7 +1,21 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import IntegrityError, transaction
+from django.test import TestCase, override_settings
+from PIL import Image
+from core.models import StoredFile
+from core.storage import ContentAddressedStorage
 
-from ..models import Group, Post
+from .. import counters, feed_cache, thumbnails, timeline
+from ..models import Comment, Follow, Group, Post, UserStats
 
 User = get_user_model()
 
@@ -61,3 +75,166 @@ class PostModelTest(TestCase):
                     post._meta.get_field(field).help_text,
                     expected_value
                 )
+
+    def test_deferred_posts_loaded_in_one_query(self):
+        """Сигналы post_init не подгружают отложенные поля."""
+        Post.objects.create(author=self.user, text='Ещё пост')
+        with self.assertNumQueries(1):
+            list(Post.objects.only('id'))
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+
+    def test_counters_follow_writes(self):
+        """Счётчики меняются при создании и удалении объектов."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        comment = Comment.objects.create(
+            post=post, author=self.reader, text='Комментарий'
+        )
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        post.refresh_from_db()
+        self.author.stats.refresh_from_db()
+        self.reader.stats.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+        self.assertEqual(self.author.stats.post_count, 1)
+        self.assertEqual(self.author.stats.follower_count, 1)
+        self.assertEqual(self.reader.stats.following_count, 1)
+        comment.delete()
+        follow.delete()
+        post.refresh_from_db()
+        self.author.stats.refresh_from_db()
+        self.reader.stats.refresh_from_db()
+        self.assertEqual(post.comment_count, 0)
+        self.assertEqual(self.author.stats.follower_count, 0)
+        self.assertEqual(self.reader.stats.following_count, 0)
+        post.delete()
+        self.author.stats.refresh_from_db()
+        self.assertEqual(self.author.stats.post_count, 0)
+
+    def test_follow_is_unique(self):
+        """Повторная подписка на автора не создаётся."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Follow.objects.create(user=self.reader, author=self.author)
+
+    def test_recount_counters_command(self):
+        """Команда recount_counters исправляет расхождения."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        Comment.objects.create(post=post, author=self.reader, text='Текст')
+        UserStats.objects.filter(user=self.author).update(post_count=7)
+        Post.objects.filter(pk=post.pk).update(comment_count=0)
+        scope = feed_cache.post_scope(post.pk)
+        generation = feed_cache.get_generations([scope])
+        call_command('recount_counters', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+        self.assertNotEqual(feed_cache.get_generations([scope]), generation)
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).post_count, 1
+        )
+
+
+class SeedYatubeCommandTest(TestCase):
+    def test_seed_yatube_command(self):
+        """Команда seed_yatube создаёт согласованные данные."""
+        call_command(
+            'seed_yatube', users=30, groups=3, posts=100, comments=50,
+            follows=5, stdout=StringIO()
+        )
+        self.assertEqual(Post.objects.count(), 100)
+        self.assertEqual(Comment.objects.count(), 50)
+        self.assertEqual(counters.recount(), (0, 0))
+        reader = User.objects.filter(follower__isnull=False).first()
+        self.assertTrue(timeline.follow_feed(reader).exists())
+
+
+class MigrateMediaCommandTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+
+    def test_migrate_media_command(self):
+        """migrate_media объединяет одинаковые картинки и удаляет лишние."""
+        os.makedirs(os.path.join(self.media, 'posts'))
+        for name, content in (('a.jpg', b'same'), ('b.jpg', b'same'),
+                              ('orphan.jpg', b'orphan')):
+            with open(os.path.join(self.media, 'posts', name), 'wb') as image:
+                image.write(content)
+        first = Post.objects.create(
+            author=self.author, text='Первый', image='posts/a.jpg'
+        )
+        second = Post.objects.create(
+            author=self.author, text='Второй', image='posts/b.jpg'
+        )
+        output = StringIO()
+        with override_settings(MEDIA_ROOT=self.media):
+            call_command('migrate_media', stdout=output)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(
+            StoredFile.objects.get(name=first.image.name).references, 2
+        )
+        self.assertEqual(
+            sorted(
+                name for _, _, files in os.walk(self.media) for name in files
+            ),
+            [os.path.basename(first.image.name)]
+        )
+        self.assertIn('дубликатов: 1, файлов без ссылок: 1', output.getvalue())
+
+    def test_migrate_media_keeps_file_in_place(self):
+        """Файл, уже лежащий по своему хешу, только получает StoredFile."""
+        name = ContentAddressedStorage().content_name(
+            'posts/a.jpg', hashlib.sha256(b'image').hexdigest()
+        )
+        path = os.path.join(self.media, name)
+        os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as image:
+            image.write(b'image')
+        Post.objects.create(author=self.author, text='Текст', image=name)
+        output = StringIO()
+        with override_settings(MEDIA_ROOT=self.media):
+            call_command('migrate_media', stdout=output)
+        self.assertTrue(os.path.exists(path))
+        stored = StoredFile.objects.get(name=name)
+        self.assertEqual((stored.references, stored.size), (1, 5))
+        self.assertIn('Перенесено файлов: 0,', output.getvalue())
+
+
+class BackfillThumbnailsCommandTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+
+    def test_backfill_thumbnails_command(self):
+        """backfill_thumbnails находит картинки во вложенных каталогах."""
+        source = BytesIO()
+        Image.new('RGB', (20, 10)).save(source, 'JPEG')
+        output = StringIO()
+        with override_settings(MEDIA_ROOT=self.media):
+            post = Post.objects.create(
+                author=self.author, text='С картинкой',
+                image=ContentFile(source.getvalue(), name='a.jpg')
+            )
+            # sorl пишет в базу из потока пула, а тестовая транзакция
+            # SQLite держит блокировку, поэтому миниатюры не создаются.
+            with mock.patch.object(thumbnails, 'generate') as generate:
+                call_command('backfill_thumbnails', stdout=output)
+        generate.assert_called_once_with(post.image.name)
+        self.assertIn('Обработано картинок: 1 из 1', output.getvalue())
@@ -1,12 +1,20 @@
+from unittest import mock
+
 from django import forms
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from yatube.settings import posts_per_page
 
-from ..models import Group, Post
+from .. import admin as post_admin
+from .. import authors, feed_cache, groups, search
+from ..models import Comment, Follow, Group, Post, TimelineEntry
+from ..paginators import NEXT, CursorPaginator, encode_cursor
 
 User = get_user_model()
 
@@ -120,6 +128,72 @@ class PostsViewTests(TestCase):
                     posts_per_page
                 )
 
+    def test_cursor_pagination(self):
+        """Курсоры ведут на следующую и предыдущую страницы
+        без пропусков и повторов записей.
+        """
+        url = reverse(
+            'posts:profile',
+            kwargs={'username': PostsViewTests.user.username}
+        )
+        first_page = self.client.get(url).context['page_obj']
+        self.assertIsNone(first_page.previous_cursor)
+        self.assertIsNotNone(first_page.next_cursor)
+        second_page = self.client.get(
+            url, {'cursor': first_page.next_cursor}
+        ).context['page_obj']
+        self.assertIsNone(second_page.next_cursor)
+        self.assertEqual(
+            list(first_page) + list(second_page),
+            list(Post.objects.filter(author=PostsViewTests.user))
+        )
+        previous_page = self.client.get(
+            url, {'cursor': second_page.previous_cursor}
+        ).context['page_obj']
+        self.assertEqual(list(previous_page), list(first_page))
+
+    def test_cursor_page_uses_index_range(self):
+        """Страница по курсору начинает поиск по индексу с позиции
+        курсора, а не просматривает ленту с самой новой записи.
+
+        Простое условие на pub_date рядом с OR нужно старым версиям
+        SQLite, которые сами не выводят его из OR.
+        """
+        paginator = CursorPaginator(Post.objects.all(), posts_per_page)
+        following = encode_cursor(NEXT, Post.objects.first())
+        preceding = paginator.get_cursor_page(following).previous_cursor
+        for cursor in (following, preceding):
+            with self.subTest(cursor=cursor):
+                with CaptureQueriesContext(connection) as queries:
+                    paginator.get_cursor_page(cursor)
+                sql = queries[0]['sql']
+                self.assertRegex(
+                    sql, r'\) AND "posts_post"\."pub_date" [<>]= '
+                )
+                with connection.cursor() as db:
+                    db.execute('EXPLAIN QUERY PLAN ' + sql)
+                    plan = ' | '.join(str(row[-1]) for row in db.fetchall())
+                self.assertRegex(plan, r'SEARCH .* \(pub_date[<>]')
+                self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_legacy_page_number(self):
+        """Ссылки вида ?page=N продолжают работать."""
+        response = self.client.get(
+            reverse(
+                'posts:profile',
+                kwargs={'username': PostsViewTests.user.username}
+            ),
+            {'page': 2}
+        )
+        self.assertEqual(
+            list(response.context['page_obj']),
+            list(
+                Post.objects.filter(
+                    author=PostsViewTests.user
+                )[posts_per_page:]
+            )
+        )
+
     def test_index_correct_context(self):
         """Шаблон index сформирован с правильным контекстом."""
         response = self.authorized_client1.get(reverse('posts:index'))
@@ -251,21 +325,47 @@ class PostsViewTests(TestCase):
                     self.assertEqual(post_image, Post.objects.get(id=1).image)
 
     def test_cache(self):
-        """Проверка работы кеша."""
+        """Главная страница отдаётся из кеша, пока нет новых записей,
+        и обновляется сразу после публикации.
+        """
         form_data = {
             'text': 'Тестовый текст'
         }
         response1 = self.client.get(reverse('posts:index'))
+        with self.assertNumQueries(0):
+            response2 = self.client.get(reverse('posts:index'))
+        self.assertEqual(response1.content, response2.content)
         self.authorized_client1.post(
             reverse('posts:post_create'),
             data=form_data,
             follow=True
         )
-        response2 = self.client.get(reverse('posts:index'))
-        self.assertEqual(response1.content, response2.content)
-        cache.clear()
-        response3 = self.client.get('posts:index')
+        response3 = self.client.get(reverse('posts:index'))
         self.assertNotEqual(response1.content, response3.content)
+        self.assertContains(response3, form_data['text'])
+
+    def test_cache_scopes(self):
+        """Запись в группу обновляет страницу этой группы
+        и не сбрасывает кеш другой группы.
+        """
+        group1_url = reverse(
+            'posts:group_list',
+            kwargs={'slug': PostsViewTests.group1.slug}
+        )
+        group2_url = reverse(
+            'posts:group_list',
+            kwargs={'slug': PostsViewTests.group2.slug}
+        )
+        self.client.get(group1_url)
+        self.client.get(group2_url)
+        Post.objects.create(
+            text='Новая запись группы',
+            author=self.user1,
+            group=PostsViewTests.group2,
+        )
+        with self.assertNumQueries(0):
+            self.client.get(group1_url)
+        self.assertContains(self.client.get(group2_url), 'Новая запись группы')
 
     def test_follow(self):
         """Авторизованный пользователь может подписываться
@@ -299,6 +399,26 @@ class PostsViewTests(TestCase):
             self.user2.follower.values_list('author', flat=True)
         )
 
+    def test_unfollow_twice(self):
+        """Повторная отписка, в том числе по устаревшему кешу подписок,
+        не приводит к ошибке.
+        """
+        url = reverse(
+            'posts:profile_unfollow', kwargs={'username': self.user1.username}
+        )
+        self.authorized_client3.get(url)
+        with mock.patch.object(
+            authors, 'followed_authors', return_value={self.user1.pk}
+        ):
+            response = self.authorized_client3.get(url)
+        self.assertRedirects(
+            response,
+            reverse('posts:profile', kwargs={'username': self.user1.username})
+        )
+        self.assertFalse(
+            Follow.objects.filter(user=self.user3, author=self.user1).exists()
+        )
+
     def test_new_post_follow(self):
         """Новая запись пользователя появляется в ленте тех,
         кто на него подписан.
@@ -338,3 +458,324 @@ class PostsViewTests(TestCase):
             reverse('posts:follow_index')
         )
         self.assertNotContains(response, form_data['text'])
+
+    def test_new_post_fan_out(self):
+        """Новая запись раскладывается в ленты подписчиков,
+        а отписка убирает записи автора из ленты.
+        """
+        post = Post.objects.create(text='Новая запись', author=self.user1)
+        self.assertTrue(
+            TimelineEntry.objects.filter(user=self.user3, post=post).exists()
+        )
+        self.authorized_client3.get(
+            reverse(
+                'posts:profile_unfollow',
+                kwargs={'username': self.user1.username}
+            )
+        )
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.user3).exists()
+        )
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS=0)
+    def test_popular_author_fan_out_on_read(self):
+        """Записи популярного автора не раскладываются по лентам,
+        но подмешиваются в ленту подписчика при чтении.
+        """
+        form_data = {
+            'text': 'Запись популярного автора'
+        }
+        self.authorized_client1.post(
+            reverse('posts:post_create'),
+            data=form_data,
+            follow=True
+        )
+        post = Post.objects.get(text=form_data['text'])
+        self.assertFalse(
+            TimelineEntry.objects.filter(post=post).exists()
+        )
+        response = self.authorized_client3.get(
+            reverse('posts:follow_index')
+        )
+        self.assertContains(response, form_data['text'])
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS=1, FEED_BACKFILL_POSTS=1)
+    def test_author_below_threshold_backfilled(self):
+        """Когда автор перестаёт быть популярным, его последние записи
+        раскладываются по лентам подписчиков.
+        """
+        Follow.objects.create(user=self.user2, author=self.user1)
+        older = Post.objects.create(text='Раньше', author=self.user1)
+        post = Post.objects.create(text='Пока популярен', author=self.user1)
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+        Follow.objects.filter(user=self.user2, author=self.user1).delete()
+        self.assertTrue(
+            TimelineEntry.objects.filter(user=self.user3, post=post).exists()
+        )
+        self.assertFalse(TimelineEntry.objects.filter(post=older).exists())
+
+
+class PostsQueryCountTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.reader = User.objects.create_user(username='Reader')
+        for i in range(posts_per_page + 2):
+            author = User.objects.create_user(username=f'Author{i}')
+            Follow.objects.create(user=cls.reader, author=author)
+            post = Post.objects.create(
+                text=f'Запись {i}',
+                author=author,
+                group=cls.group,
+            )
+            Comment.objects.create(post=post, author=author, text='Ответ')
+        cls.author = author
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(PostsQueryCountTests.reader)
+        cache.clear()
+        # Справочник групп в рабочем процессе почти всегда загружен.
+        groups.get_directory()
+
+    def test_feed_query_count(self):
+        """Число запросов на страницу ленты не зависит от числа постов.
+
+        Карточки постов загружаются одним запросом, а из кеша карточек
+        страница собирается вовсе без него. Группа берётся из справочника.
+        """
+        slug = PostsQueryCountTests.group.slug
+        username = PostsQueryCountTests.author.username
+        pages_queries = {
+            reverse('posts:index'): 1,
+            reverse('posts:group_list', kwargs={'slug': slug}): 1,
+            reverse('posts:profile', kwargs={'username': username}): 2,
+        }
+        for page, queries in pages_queries.items():
+            with self.subTest(page=page):
+                cache.clear()
+                groups.get_directory()
+                with self.assertNumQueries(queries + 1):
+                    self.client.get(page)
+                feed_cache.bump(
+                    feed_cache.GLOBAL,
+                    feed_cache.group_scope(slug),
+                    feed_cache.author_scope(username)
+                )
+                with self.assertNumQueries(queries):
+                    self.client.get(page)
+
+    def test_follow_feed_query_count(self):
+        """Лента подписок строится фиксированным числом запросов."""
+        with self.assertNumQueries(5):
+            self.authorized_client.get(reverse('posts:follow_index'))
+        feed_cache.bump(feed_cache.GLOBAL)
+        with self.assertNumQueries(4):
+            self.authorized_client.get(reverse('posts:follow_index'))
+
+    def test_cached_cards_invalidation(self):
+        """Карточка обновляется при правке поста и смене имени автора."""
+        author = PostsQueryCountTests.author
+        post = author.posts.get()
+        self.client.get(reverse('posts:index'))
+        post.text = 'Исправленная запись'
+        post.save()
+        author.first_name = 'Новое'
+        author.save()
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'Исправленная запись')
+        self.assertContains(response, 'Новое')
+
+    def test_group_directory_refreshed_on_save(self):
+        """Переименование группы сразу видно в справочнике и карточках."""
+        group = PostsQueryCountTests.group
+        with self.assertNumQueries(0):
+            self.assertEqual(groups.get_group_or_404(group.slug), group)
+        group.title = 'Новое название'
+        group.save()
+        with self.assertNumQueries(1):
+            directory = groups.get_directory()
+        self.assertEqual(directory.by_id[group.pk].title, 'Новое название')
+        response = self.client.get(
+            reverse('posts:group_list', kwargs={'slug': group.slug})
+        )
+        self.assertContains(response, 'Новое название')
+
+    def test_author_summary_and_follows_cached(self):
+        """Профиль и кнопка подписки не требуют запросов при попадании."""
+        author = PostsQueryCountTests.author
+        reader = PostsQueryCountTests.reader
+        summary = authors.get_author(author.username)
+        self.assertEqual(summary, author)
+        self.assertEqual(summary.stats.post_count, 1)
+        self.assertEqual(summary.stats.follower_count, 1)
+        self.assertIn(author.pk, authors.followed_authors(reader))
+        with self.assertNumQueries(0):
+            authors.get_author(author.username)
+            authors.followed_authors(reader)
+        self.authorized_client.get(
+            reverse('posts:profile_unfollow', args=[author.username])
+        )
+        self.assertNotIn(author.pk, authors.followed_authors(reader))
+        self.assertEqual(
+            authors.get_author(author.username).stats.follower_count, 0
+        )
+        self.assertIsNone(authors.get_author('nobody'))
+
+    def test_post_detail_comments_paginated(self):
+        """Комментарии выводятся страницами, остальные подгружаются."""
+        post = PostsQueryCountTests.author.posts.get()
+        Comment.objects.bulk_create(
+            Comment(post=post, author=PostsQueryCountTests.reader,
+                    text=f'Комментарий {i}')
+            for i in range(settings.COMMENTS_PER_PAGE)
+        )
+        url = reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        comments = response.context['comments']
+        self.assertEqual(len(comments), settings.COMMENTS_PER_PAGE)
+        self.assertEqual(comments[0].text, 'Ответ')
+        self.assertIsNotNone(comments.next_cursor)
+        response = self.client.get(
+            reverse('posts:post_comments', kwargs={'post_id': post.pk}),
+            {'cursor': comments.next_cursor}
+        )
+        self.assertTemplateUsed(response, 'posts/includes/comment_list.html')
+        self.assertEqual(
+            [comment.text for comment in response.context['comments']],
+            [f'Комментарий {settings.COMMENTS_PER_PAGE - 1}']
+        )
+        self.assertIsNone(response.context['comments'].next_cursor)
+
+    def test_feed_order_uses_index(self):
+        """Ленты читаются по индексу в нужном порядке без сортировки."""
+        feeds = {
+            'index': Post.objects.for_feed(),
+            'profile': Post.objects.for_feed().filter(
+                author=PostsQueryCountTests.author
+            ),
+            'group_posts': Post.objects.for_feed().filter(
+                group=PostsQueryCountTests.group
+            ),
+        }
+        for name, queryset in feeds.items():
+            with self.subTest(feed=name):
+                plan = queryset[:posts_per_page + 1].explain()
+                self.assertIn('USING INDEX', plan)
+                self.assertNotIn('TEMP B-TREE', plan)
+
+
+class PostsSearchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='TestUser')
+        cls.group = Group.objects.create(
+            title='Путешествия',
+            slug='travel',
+            description='Тестовое описание',
+        )
+        cls.posts = [
+            Post.objects.create(
+                text=f'Заметка номер {i} про горы',
+                author=cls.user,
+            )
+            for i in range(posts_per_page + 3)
+        ]
+        cls.group_post = Post.objects.create(
+            text='Без ключевого слова',
+            author=cls.user,
+            group=cls.group,
+        )
+
+    def test_search_pages(self):
+        """Поиск находит все посты со словом постранично без повторов."""
+        url = reverse('posts:post_search')
+        response = self.client.get(url, {'q': 'горы'})
+        first_page = response.context['posts']
+        self.assertEqual(len(first_page), posts_per_page)
+        response = self.client.get(
+            url, {'q': 'горы', 'cursor': response.context['next_cursor']}
+        )
+        self.assertIsNone(response.context['next_cursor'])
+        self.assertCountEqual(
+            [post.pk for post in first_page + response.context['posts']],
+            [post.pk for post in PostsSearchTests.posts]
+        )
+
+    def test_search_group_title_and_updates(self):
+        """Поиск учитывает название группы и изменения постов."""
+        post_ids, _ = search.search('путешеств')
+        self.assertEqual(post_ids, [PostsSearchTests.group_post.pk])
+        post = Post.objects.get(pk=PostsSearchTests.posts[0].pk)
+        post.text = 'Теперь про море'
+        post.save()
+        self.assertEqual(search.search('море')[0], [post.pk])
+        post.delete()
+        self.assertEqual(search.search('море')[0], [])
+
+    def test_memory_index(self):
+        """Запасной индекс в памяти ранжирует так же, как FTS5."""
+        memory_index = search.MemoryIndex()
+        self.assertEqual(
+            [post_id for _, post_id in memory_index.search('номер 5')],
+            [PostsSearchTests.posts[5].pk]
+        )
+        self.assertCountEqual(
+            [post_id for _, post_id in memory_index.search('горы', 100)],
+            [post.pk for post in PostsSearchTests.posts]
+        )
+
+    def test_memory_index_shared_invalidation(self):
+        """Изменение поста, проиндексированное в одном процессе,
+        видно индексу в памяти другого процесса.
+        """
+        reader, writer = search.MemoryIndex(), search.MemoryIndex()
+        self.assertEqual(reader.search('вулкан'), [])
+        post = PostsSearchTests.posts[0]
+        writer.index(post.pk, 'Про вулкан', '')
+        Post.objects.filter(pk=post.pk).update(text='Про вулкан')
+        self.assertEqual(
+            [post_id for _, post_id in reader.search('вулкан')], [post.pk]
+        )
+
+    def test_memory_index_updates_in_place(self):
+        """Процесс, изменивший пост, обновляет свой индекс без
+        перечитывания всех постов.
+        """
+        memory_index = search.MemoryIndex()
+        memory_index.search('горы')
+        post = PostsSearchTests.posts[0]
+        with self.assertNumQueries(0):
+            memory_index.index(post.pk, 'Про вулкан', '')
+            self.assertEqual(
+                [post_id for _, post_id in memory_index.search('вулкан')],
+                [post.pk]
+            )
+            memory_index.remove(post.pk)
+            self.assertEqual(memory_index.search('вулкан'), [])
+
+    def test_admin_search(self):
+        """Поиск в админке использует полнотекстовый индекс."""
+        admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'ключевого'}
+        )
+        self.assertEqual(
+            list(response.context['cl'].result_list),
+            [PostsSearchTests.group_post]
+        )
+        with mock.patch.object(post_admin, 'SEARCH_LIMIT', 2):
+            response = self.client.get(
+                reverse('admin:posts_post_changelist'), {'q': 'горы'}
+            )
+        self.assertEqual(response.context['cl'].result_count, 2)
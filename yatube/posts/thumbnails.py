@@ -0,0 +1,100 @@
+"""Фоновая подготовка миниатюр для картинок постов.
+
+sorl-thumbnail создаёт миниатюру при первой отрисовке шаблона, и этот
+запрос ждёт, пока Pillow обработает картинку. При THUMBNAIL_ASYNC
+миниатюры всех размеров из POST_THUMBNAILS создаются в пуле потоков
+сразу после сохранения картинки, а шаблон до их готовности показывает
+заглушку.
+Страницы с заглушкой закешированы под поколениями лент, поэтому после
+создания миниатюр поколения постов с этой картинкой меняются.
+"""
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from sorl.thumbnail import get_thumbnail
+
+from . import feed_cache, groups
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def _key(prefix, *parts):
+    return prefix + hashlib.md5(':'.join(parts).encode()).hexdigest()
+
+
+def _executor_instance():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS,
+            thread_name_prefix='thumbnails'
+        )
+    return _executor
+
+
+def generate(name):
+    """Создаёт все миниатюры картинки и запоминает их адреса."""
+    ready = {}
+    for alias, (geometry, options) in settings.POST_THUMBNAILS.items():
+        thumbnail = get_thumbnail(name, geometry, **options)
+        ready[_key('thumbnail-url:', name, alias)] = thumbnail.url
+    cache.set_many(ready, timeout=None)
+    return ready
+
+
+def invalidate_pages(names):
+    """Сбрасывает закешированные страницы постов с картинками names."""
+    by_group_id = groups.get_directory().by_id
+    scopes = {feed_cache.GLOBAL}
+    posts = Post.objects.filter(image__in=names).values_list(
+        'pk', 'author__username', 'group_id'
+    )
+    for pk, username, group_id in posts:
+        scopes.add(feed_cache.post_scope(pk))
+        scopes.add(feed_cache.author_scope(username))
+        if group_id in by_group_id:
+            scopes.add(feed_cache.group_scope(by_group_id[group_id].slug))
+    feed_cache.bump(*scopes)
+
+
+def _generate_in_background(name):
+    try:
+        generate(name)
+        invalidate_pages([name])
+    except Exception:
+        logger.exception('Не удалось создать миниатюры для %s', name)
+    finally:
+        cache.delete(_key('thumbnail-pending:', name))
+        # sorl хранит сведения о миниатюрах в базе; соединение потока
+        # пула закрывается сразу, а не висит до завершения процесса.
+        connection.close()
+
+
+def schedule(name):
+    """Ставит картинку в очередь на создание миниатюр."""
+    if not settings.THUMBNAIL_ASYNC:
+        generate(name)
+        return
+    if not cache.add(_key('thumbnail-pending:', name), True, 60):
+        return
+    transaction.on_commit(
+        lambda: _executor_instance().submit(_generate_in_background, name)
+    )
+
+
+def thumbnail_url(name, alias):
+    """Адрес готовой миниатюры или None, пока она создаётся."""
+    url = cache.get(_key('thumbnail-url:', name, alias))
+    if url is None and default_storage.exists(name):
+        schedule(name)
+        # Если миниатюры создались сразу, адрес уже в кеше.
+        url = cache.get(_key('thumbnail-url:', name, alias))
+    return url
@@ -0,0 +1,109 @@
+"""Материализованная лента подписок (fan-out on write).
+
+Новый пост автора сразу раскладывается в TimelineEntry всех его
+подписчиков, поэтому follow_index читает ленту одним запросом по своему
+пользователю. Для авторов, у которых подписчиков больше
+FEED_FANOUT_MAX_FOLLOWERS, раскладка не выполняется: их посты
+подмешиваются в ленту при чтении (fan-out on read). Когда автор снова
+становится непопулярным, его последние FEED_BACKFILL_POSTS постов
+раскладываются по лентам всех подписчиков (backfill_author), иначе
+написанные за время популярности посты пропали бы из лент. Все посты
+раскладывает команда recount_counters.
+"""
+from django.conf import settings
+from django.db.models import Q
+
+from .models import Follow, Post, TimelineEntry, UserStats
+
+BATCH_SIZE = 500
+
+
+def is_popular(author_id):
+    return UserStats.objects.filter(
+        user_id=author_id,
+        follower_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS
+    ).exists()
+
+
+def popular_authors(user):
+    """Авторы из подписок пользователя, чьи посты читаются напрямую."""
+    return Follow.objects.filter(
+        user=user,
+        author__stats__follower_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS
+    ).values_list('author', flat=True)
+
+
+def fan_out_post(post):
+    if is_popular(post.author_id):
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user', flat=True)
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(user_id=user_id, post=post) for user_id in followers),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True
+    )
+
+
+def backfill(user_id, author_id):
+    if is_popular(author_id):
+        return
+    posts = Post.objects.filter(
+        author_id=author_id
+    ).values_list('pk', flat=True)
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(user_id=user_id, post_id=pk) for pk in posts),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True
+    )
+
+
+def backfill_author(author_id, limit=None):
+    """Раскладывает последние limit постов автора (по умолчанию все)
+    по лентам всех его подписчиков.
+    """
+    if is_popular(author_id):
+        return
+    followers = list(Follow.objects.filter(
+        author_id=author_id
+    ).values_list('user', flat=True))
+    posts = Post.objects.filter(
+        author_id=author_id
+    ).order_by('-pub_date', '-id').values_list('pk', flat=True)[:limit]
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(user_id=user_id, post_id=pk)
+            for pk in posts.iterator() for user_id in followers
+        ),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True
+    )
+
+
+def lost_follower(author_id):
+    """Вызывается после отписки, когда счётчик уже уменьшен."""
+    if UserStats.objects.filter(
+        user_id=author_id,
+        follower_count=settings.FEED_FANOUT_MAX_FOLLOWERS
+    ).exists():
+        # Автор только что опустился до порога. Отписка идёт в запросе
+        # пользователя, поэтому раскладываются только последние посты.
+        backfill_author(author_id, settings.FEED_BACKFILL_POSTS)
+
+
+def prune(user_id, author_id):
+    TimelineEntry.objects.filter(
+        user_id=user_id,
+        post__author_id=author_id
+    ).delete()
+
+
+def follow_feed(user):
+    condition = Q(
+        pk__in=TimelineEntry.objects.filter(user=user).values('post')
+    )
+    authors = list(popular_authors(user))
+    if authors:
+        condition |= Q(author_id__in=authors)
+    return Post.objects.filter(condition)
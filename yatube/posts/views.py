@@ -1,36 +1,58 @@
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
+from django.db import transaction
+from django.http import Http404
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
+from django.views.decorators.http import require_safe
 from yatube.settings import posts_per_page
 
+from . import (authors, commenting, fragments, groups, search, thumbnails,
+               timeline)
+from .feed_cache import (GLOBAL, author_scope, cache_feed, follow_scope,
+                         group_scope)
 from .forms import CommentForm, PostForm
-from .models import Follow, Group, Post, User
+from .models import Comment, Follow, Post
+from .paginators import ChronologicalPaginator, CursorPaginator
 
 
 def paginator(post_list, posts_per_page, request):
-    paginator = Paginator(post_list, posts_per_page)
     page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    return page_obj
+    if page_number is not None:
+        # Старые ссылки вида ?page=N продолжают работать через OFFSET.
+        paginator = Paginator(post_list, posts_per_page)
+        return paginator.get_page(page_number)
+    paginator = CursorPaginator(post_list, posts_per_page)
+    return paginator.get_cursor_page(request.GET.get('cursor'))
 
 
-@cache_page(20)
+def comment_page(request, post_id):
+    comments = Comment.objects.filter(post_id=post_id).select_related(
+        'author'
+    )
+    paginator = ChronologicalPaginator(comments, settings.COMMENTS_PER_PAGE)
+    return paginator.get_cursor_page(request.GET.get('cursor'))
+
+
+@cache_feed(GLOBAL)
 def index(request):
     template = 'posts/index.html'
-    post_list = Post.objects.all()
+    post_list = Post.objects.for_cards()
     page_obj = paginator(post_list, posts_per_page, request)
+    page_obj.object_list = fragments.attach_cards(page_obj.object_list)
     context = {
         'page_obj': page_obj,
     }
     return render(request, template, context)
 
 
+@cache_feed(group_scope('{slug}'))
 def group_posts(request, slug):
     template = 'posts/group_list.html'
-    group = get_object_or_404(Group, slug=slug)
-    post_list = group.posts_group.all()
+    group = groups.get_group_or_404(slug)
+    post_list = Post.objects.for_cards().filter(group_id=group.pk)
     page_obj = paginator(post_list, posts_per_page, request)
+    page_obj.object_list = fragments.attach_cards(page_obj.object_list)
     context = {
         'group': group,
         'page_obj': page_obj,
@@ -38,15 +60,16 @@ def group_posts(request, slug):
     return render(request, template, context)
 
 
+@cache_feed(author_scope('{username}'))
 def profile(request, username):
     template = 'posts/profile.html'
-    user = request.user
-    author = get_object_or_404(User, username=username)
-    post_list = author.posts.all()
+    author = authors.get_author_or_404(username)
+    post_list = Post.objects.for_cards().filter(author_id=author.pk)
     page_obj = paginator(post_list, posts_per_page, request)
-    following = False
-    if user.is_authenticated:
-        following = Follow.objects.filter(user=user, author=author).exists()
+    page_obj.object_list = fragments.attach_cards(
+        page_obj.object_list, show_author=False
+    )
+    following = author.pk in authors.followed_authors(request.user)
     context = {
         'page_obj': page_obj,
         'author': author,
@@ -57,8 +80,12 @@ def profile(request, username):
 
 def post_detail(request, post_id):
     template = 'posts/post_detail.html'
-    post = get_object_or_404(Post, pk=post_id)
-    comments = post.comments.all()
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats'),
+        pk=post_id
+    )
+    groups.attach_groups([post])
+    comments = comment_page(request, post.pk)
     form = CommentForm(request.POST or None)
     context = {
         'post': post,
@@ -68,6 +95,36 @@ def post_detail(request, post_id):
     return render(request, template, context)
 
 
+@require_safe
+def post_comments(request, post_id):
+    """Следующая страница комментариев фрагментом HTML для подгрузки."""
+    template = 'posts/includes/comment_list.html'
+    if not commenting.post_exists(post_id):
+        raise Http404('Пост не найден')
+    context = {
+        'post_id': post_id,
+        'comments': comment_page(request, post_id),
+    }
+    return render(request, template, context)
+
+
+def post_search(request):
+    template = 'posts/search.html'
+    query = request.GET.get('q', '').strip()
+    post_ids, next_cursor = search.search(
+        query, posts_per_page, request.GET.get('cursor')
+    )
+    posts = Post.objects.for_cards().in_bulk(post_ids)
+    context = {
+        'query': query,
+        'posts': fragments.attach_cards(
+            posts[pk] for pk in post_ids if pk in posts
+        ),
+        'next_cursor': next_cursor,
+    }
+    return render(request, template, context)
+
+
 @login_required
 def post_create(request):
     template = 'posts/create_post.html'
@@ -78,7 +135,10 @@ def post_create(request):
     if form.is_valid():
         post = form.save(commit=False)
         post.author = request.user
-        post.save()
+        with transaction.atomic():
+            post.save()
+        if post.image:
+            thumbnails.schedule(post.image.name)
         return redirect('posts:profile', username=post.author)
     return render(request, template, {'form': form})
 
@@ -95,8 +155,11 @@ def post_edit(request, post_id):
     )
     if form.is_valid():
         post = form.save(commit=False)
-        post.author = request.user
-        post.save()
+        # Только поля формы: полное сохранение затёрло бы comment_count,
+        # увеличенный параллельно добавленным комментарием.
+        post.save(update_fields=form.Meta.fields)
+        if post.image and 'image' in form.changed_data:
+            thumbnails.schedule(post.image.name)
         return redirect('posts:post_detail', post_id=post.id)
     context = {
         'form': form,
@@ -108,23 +171,28 @@ def post_edit(request, post_id):
 
 @login_required
 def add_comment(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    if not commenting.post_exists(post_id):
+        raise Http404('Пост не найден')
     form = CommentForm(request.POST or None)
     if form.is_valid():
+        if not commenting.allow(request.user.pk):
+            response = render(request, 'core/429.html', status=429)
+            response['Retry-After'] = commenting.retry_after(request.user.pk)
+            return response
         comment = form.save(commit=False)
         comment.author = request.user
-        comment.post = post
-        comment.save()
+        comment.post_id = post_id
+        commenting.submit(comment)
     return redirect('posts:post_detail', post_id=post_id)
 
 
 @login_required
+@cache_feed(GLOBAL, follow_scope('{user_id}'))
 def follow_index(request):
     template = 'posts/follow.html'
-    user = request.user
-    authors = user.follower.values_list('author', flat=True)
-    post_list = Post.objects.filter(author__id__in=authors)
+    post_list = timeline.follow_feed(request.user).for_cards()
     page_obj = paginator(post_list, posts_per_page, request)
+    page_obj.object_list = fragments.attach_cards(page_obj.object_list)
     context = {
         'page_obj': page_obj,
     }
@@ -134,14 +202,18 @@ def follow_index(request):
 @login_required
 def profile_follow(request, username):
     user = request.user
-    author = get_object_or_404(User, username=username)
-    if user != author:
-        Follow.objects.get_or_create(user=user, author=author)
+    author = authors.get_author_or_404(username)
+    if user != author and author.pk not in authors.followed_authors(user):
+        with transaction.atomic():
+            Follow.objects.get_or_create(user=user, author=author)
     return redirect('posts:profile', username=username)
 
 
 @login_required
 def profile_unfollow(request, username):
     user = request.user
-    Follow.objects.get(user=user, author__username=username).delete()
+    author = authors.get_author_or_404(username)
+    # Повторная отправка формы или параллельный запрос могли уже удалить
+    # подписку; сигналы post_delete сбросят кеши, только если она была.
+    Follow.objects.filter(user=user, author=author).delete()
     return redirect('posts:profile', username=username)
@@ -51,7 +51,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'core.db_router.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -65,7 +67,9 @@ ROOT_URLCONF = 'yatube.urls'
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates, время рендеринга которого входит в замеры.
+        'BACKEND': 'core.metrics.MeasuredTemplates',
+        'NAME': 'django',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -93,6 +97,23 @@ DATABASES = {
     }
 }
 
+# PRAGMA для каждого нового соединения с SQLite, см. settings_production.
+SQLITE_PRAGMAS = {}
+
+# Чтения из запросов GET уходят на реплики, записи — в default. Для
+# проверки на одной машине реплику изображает копия файла SQLite,
+# которую обновляет команда sync_replica.
+DATABASE_ROUTERS = ['core.db_router.ReplicaRouter']
+DATABASE_REPLICAS = []
+REPLICA_STICKY_SECONDS = 5
+if os.environ.get('YATUBE_REPLICA'):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['YATUBE_REPLICA'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS = ['replica']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -131,6 +152,7 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/2.2/howto/static-files/
 
 STATIC_URL = '/static/'
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
@@ -140,17 +162,109 @@ EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 posts_per_page = 10
+# Комментарии к посту подгружаются страницами по курсору.
+COMMENTS_PER_PAGE = 20
+# Не больше COMMENT_RATE_BURST комментариев подряд, затем один
+# в COMMENT_RATE_SECONDS. При COMMENT_BUFFER_SECONDS > 0 комментарии
+# записываются в базу пачками раз в указанный интервал.
+COMMENT_RATE_BURST = 5
+COMMENT_RATE_SECONDS = 10
+COMMENT_BUFFER_SECONDS = 0
+
+# Авторы с большим числом подписчиков не раскладываются в ленты подписок
+# при публикации, их посты подмешиваются в ленту при чтении.
+FEED_FANOUT_MAX_FOLLOWERS = 1000
+# Сколько последних постов автора, опустившегося до порога, раскладывается
+# по лентам подписчиков при отписке.
+FEED_BACKFILL_POSTS = posts_per_page
 
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/2.2/howto/static-files/
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
-
+# Загрузки хранятся по хешу содержимого, одинаковые файлы не дублируются.
+DEFAULT_FILE_STORAGE = 'core.storage.ContentAddressedStorage'
+# Миниатюрам sorl сам выбирает имена, им нужно обычное хранилище.
+THUMBNAIL_STORAGE = 'django.core.files.storage.FileSystemStorage'
+
+# Файлы без хеша в имени (миниатюры, старые загрузки) кешируются на час.
+# SENDFILE_HEADER = 'X-Accel-Redirect' или 'X-Sendfile' передаёт отдачу
+# файла веб-серверу; для nginx нужен internal location SENDFILE_PREFIX.
+FILES_MAX_AGE = 60 * 60
+SENDFILE_HEADER = None
+SENDFILE_PREFIX = '/internal'
+
+# Миниатюры картинок постов создаются прямо в запросе; при
+# THUMBNAIL_ASYNC = True (так в settings_production) — в фоне сразу после
+# загрузки.
+POST_THUMBNAILS = {
+    'card': ('960x339', {'crop': 'center', 'upscale': True}),
+}
+THUMBNAIL_ASYNC = False
+THUMBNAIL_WORKERS = 4
+
+# Загруженные картинки уменьшаются и перекодируются при сохранении.
+IMAGE_MAX_SIZE = 1920
+IMAGE_MAX_PIXELS = 40 * 1000 * 1000
+IMAGE_FORMAT = 'JPEG'
+IMAGE_QUALITY = 85
+IMAGE_WORKERS = 2
+IMAGE_TIMEOUT = 30
+
+# Алиасы, к которым обращается код, обёрнуты в MeasuredCache: попадания
+# и промахи попадают в замеры запроса (core.metrics).
 CACHES = {
     'default': {
+        'BACKEND': 'core.cache.MeasuredCache',
+        'LOCATION': 'local',
+    },
+    'local': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+    },
 }
 
+# Страницы лент инвалидируются при записи, поэтому хранятся долго.
+FEED_CACHE_ALIAS = 'default'
+FEED_GENERATION_CACHE_ALIAS = 'default'
+FEED_CACHE_TIMEOUT = 60 * 60
+RATE_LIMIT_CACHE_ALIAS = 'default'
+
+# При запуске в несколько процессов кеш должен быть общим: локальный LRU
+# процесса стоит перед кешем в файле SQLite, который видят все воркеры.
+if os.environ.get('YATUBE_SHARED_CACHE'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache.MeasuredCache',
+            'LOCATION': 'two-tier',
+        },
+        'shared': {
+            'BACKEND': 'core.cache.MeasuredCache',
+            'LOCATION': 'sqlite',
+        },
+        'two-tier': {
+            'BACKEND': 'core.cache.TwoTierCache',
+            'LOCATION': 'sqlite',
+            'OPTIONS': {
+                'MAX_ENTRIES': 1000,
+                'LOCAL_TIMEOUT': 5,
+            },
+        },
+        'sqlite': {
+            'BACKEND': 'core.cache.SQLiteCache',
+            'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+            'OPTIONS': {
+                'MAX_ENTRIES': 100000,
+            },
+        },
+    }
+    FEED_GENERATION_CACHE_ALIAS = 'shared'
+    RATE_LIMIT_CACHE_ALIAS = 'shared'
+
+# Замеры запросов: заголовок Server-Timing и гистограммы на /metrics/,
+# доступные персоналу и адресам из INTERNAL_IPS.
+METRICS_ENABLED = True
+METRICS_SERVER_TIMING = True
+INTERNAL_IPS = ['127.0.0.1']
+
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
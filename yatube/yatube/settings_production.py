@@ -0,0 +1,46 @@
+"""Настройки для продакшена.
+
+Запуск: DJANGO_SETTINGS_MODULE=yatube.settings_production. Соединения с
+базой переиспользуются между запросами, а SQLite переводится в режим WAL:
+читатели не ждут писателя, и fsync выполняется только на контрольных
+точках журнала. Статика собирается с хешами в именах и сжатыми копиями
+и отдаётся с долгим кешированием (см. core.serving).
+"""
+import copy
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .settings import *  # noqa: F401,F403
+from .settings import ALLOWED_HOSTS, DATABASES
+
+DEBUG = False
+# Ключ из репозитория известен всем, запускаться с ним нельзя.
+SECRET_KEY = os.environ.get('YATUBE_SECRET_KEY')
+if not SECRET_KEY:
+    raise ImproperlyConfigured('Не задана переменная YATUBE_SECRET_KEY')
+if os.environ.get('YATUBE_ALLOWED_HOSTS'):
+    ALLOWED_HOSTS = os.environ['YATUBE_ALLOWED_HOSTS'].split(',')
+
+# Копия, чтобы импорт этого модуля не менял настройки yatube.settings.
+DATABASES = copy.deepcopy(DATABASES)
+for database in DATABASES.values():
+    database['CONN_MAX_AGE'] = 600
+    # Писатель ждёт освобождения базы, а не падает с database is locked.
+    database.setdefault('OPTIONS', {})['timeout'] = 20
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    # Отрицательное значение — размер в килобайтах, здесь 64 МБ.
+    'cache_size': -64 * 1024,
+}
+
+STATICFILES_STORAGE = 'core.staticfiles.CompressedManifestStaticFilesStorage'
+THUMBNAIL_ASYNC = True
+SENDFILE_HEADER = os.environ.get('YATUBE_SENDFILE_HEADER')
+
+# За обратным прокси все запросы приходят с 127.0.0.1 из INTERNAL_IPS,
+# поэтому заголовок Server-Timing в продакшене выключен.
+METRICS_SERVER_TIMING = False